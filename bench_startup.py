@@ -0,0 +1,163 @@
+"""Startup-time benchmark.
+
+Starts ``bot.py`` against a local fake Bot API server and reports how long
+each startup stage takes from process launch:
+
+* health  - ``/`` on the health port answers
+* poll    - first ``getUpdates`` request reaches the API
+* reply   - the bot answers a queued ``/help`` (time to first update)
+* ready   - ``/ready`` reports MongoDB and the bot as ready
+
+MongoDB is whatever MONGO_URI points at. Without a reachable server the bot
+waits for storage before polling, so only the health stage completes.
+
+Usage: python bench_startup.py [--runs N] [--max-seconds S] [--timeout S]
+Exits non-zero when the median time to first reply exceeds --max-seconds.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+import threading
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BOT_ID = 123456
+TOKEN = f"{BOT_ID}:benchmark"
+STAGES = ('health', 'poll', 'reply', 'ready')
+
+class FakeBotApi(BaseHTTPRequestHandler):
+    """Just enough of the Bot API for the bot to start and answer /help"""
+
+    events = {}
+    started = 0.0
+    update_sent = False
+
+    def do_POST(self):
+        method = self.path.rsplit('/', 1)[-1]
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        now = time.perf_counter() - FakeBotApi.started
+
+        if method == 'getMe':
+            result = {
+                'id': BOT_ID, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot',
+                'can_join_groups': True, 'can_read_all_group_messages': False,
+                'supports_inline_queries': False,
+            }
+        elif method == 'getUpdates':
+            FakeBotApi.events.setdefault('poll', now)
+            result = []
+            if not FakeBotApi.update_sent:
+                FakeBotApi.update_sent = True
+                result = [{
+                    'update_id': 1,
+                    'message': {
+                        'message_id': 1,
+                        'date': int(time.time()),
+                        'chat': {'id': 42, 'type': 'private', 'first_name': 'Bench'},
+                        'from': {'id': 42, 'is_bot': False, 'first_name': 'Bench'},
+                        'text': '/help',
+                        'entities': [{'type': 'bot_command', 'offset': 0, 'length': 5}],
+                    },
+                }]
+            else:
+                time.sleep(0.2)
+        elif method == 'sendMessage':
+            FakeBotApi.events.setdefault('reply', now)
+            result = {
+                'message_id': 2,
+                'date': int(time.time()),
+                'chat': {'id': 42, 'type': 'private'},
+                'text': 'help',
+            }
+        else:
+            result = True
+
+        body = json.dumps({'ok': True, 'result': result}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The bot was stopped in the middle of a long poll
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+def probe(url: str) -> bool:
+    try:
+        with urllib.request.urlopen(url, timeout=0.5) as response:
+            return response.status == 200
+    except Exception:
+        return False
+
+def run_once(api_port: int, health_port: int, timeout: float) -> dict:
+    FakeBotApi.events = {}
+    FakeBotApi.update_sent = False
+    env = dict(
+        os.environ,
+        BOT_TOKEN=TOKEN,
+        BOT_TOKENS='',
+        BOT_WORKERS='1',
+        PORT=str(health_port),
+        TELEGRAM_API_URL=f"http://127.0.0.1:{api_port}",
+        SNAPSHOT_DIR=os.getenv('SNAPSHOT_DIR', '/tmp'),
+    )
+    FakeBotApi.started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bot.py')],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    events = FakeBotApi.events
+    try:
+        while time.perf_counter() - FakeBotApi.started < timeout and len(events) < len(STAGES):
+            now = time.perf_counter() - FakeBotApi.started
+            if 'health' not in events and probe(f"http://127.0.0.1:{health_port}/"):
+                events['health'] = now
+            if 'ready' not in events and probe(f"http://127.0.0.1:{health_port}/ready"):
+                events['ready'] = now
+            time.sleep(0.01)
+    finally:
+        process.terminate()
+        process.wait()
+    return dict(events)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--timeout', type=float, default=20)
+    parser.add_argument('--max-seconds', type=float, default=None)
+    parser.add_argument('--health-port', type=int, default=18000)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeBotApi)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    results = [run_once(server.server_address[1], args.health_port, args.timeout) for _ in range(args.runs)]
+    server.shutdown()
+
+    medians = {}
+    for stage in STAGES:
+        times = [result[stage] for result in results if stage in result]
+        if times:
+            medians[stage] = statistics.median(times)
+            print(f"{stage:<7} median {medians[stage]:.3f}s  min {min(times):.3f}s  ({len(times)}/{len(results)} runs)")
+        else:
+            print(f"{stage:<7} not reached within {args.timeout:.0f}s")
+
+    if args.max_seconds is not None:
+        first_update = medians.get('reply')
+        if first_update is None or first_update > args.max_seconds:
+            print(f"FAIL: time to first update above {args.max_seconds}s")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
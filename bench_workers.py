@@ -0,0 +1,248 @@
+"""Throughput benchmark for the multi-worker mode.
+
+Starts ``bot.py`` with BOT_WORKERS=1, 2, 4, ... against a local fake Bot
+API and feeds it group messages from users who have not joined the
+required channel. Every update goes through the real path: receiver long
+poll -> hash ring -> worker process -> check_membership -> mute and warning.
+An update counts as handled when its warning reaches the fake API.
+
+The bot runs against a throwaway database (--database, dropped afterwards)
+on the MongoDB at --mongo-uri, passed to it explicitly so a .env file
+can't point it at production. Each group gets an fsub config. Rate limits are lifted for the run and at most IN_FLIGHT
+updates are outstanding, since the bot ignores messages older than 10s.
+The numbers show how update handling spreads over processes. The fake API
+adds --latency ms per call and runs in this process, which caps what a
+single machine can show.
+
+Usage: python bench_workers.py [--updates N] [--max-workers N] [--latency MS]
+                              [--mongo-uri URI] [--database NAME]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+BOT_ID = 123456
+TOKEN = f"{BOT_ID}:benchmark"
+CHANNEL = 'benchchannel'
+CHANNEL_ID = -1009999999999
+FIRST_CHAT = -1009000000000
+CHATS = 200
+BATCH = 50
+# Messages older than 10s are ignored by the bot, so don't let a backlog build up
+IN_FLIGHT = 100
+
+def chat_ids():
+    return [FIRST_CHAT - index for index in range(CHATS)]
+
+def make_update(update_id: int) -> dict:
+    user_id = 1000 + update_id
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': FIRST_CHAT - update_id % CHATS, 'type': 'supergroup', 'title': 'Bench'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f'User {user_id}'},
+            'text': 'hello',
+        },
+    }
+
+class FakeBotApi(BaseHTTPRequestHandler):
+    """Enough of the Bot API for check_membership to mute and warn"""
+
+    protocol_version = 'HTTP/1.1'
+    lock = threading.Lock()
+    latency = 0.0
+    total = 0
+    next_update = 0
+    started = None
+    finished = None
+    handled = 0
+    calls = 0
+
+    def params(self) -> dict:
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if not body:
+            return {}
+        if self.headers.get('Content-Type', '').startswith('application/json'):
+            return json.loads(body)
+        return {key: values[0] for key, values in parse_qs(body.decode()).items()}
+
+    def do_POST(self):
+        method = self.path.rsplit('/', 1)[-1]
+        params = self.params()
+        cls = FakeBotApi
+
+        if method == 'getUpdates':
+            with cls.lock:
+                first = cls.next_update
+                if first - cls.handled < IN_FLIGHT:
+                    cls.next_update = min(cls.total, first + BATCH)
+                if first < cls.next_update and cls.started is None:
+                    cls.started = time.perf_counter()
+            result = [make_update(update_id) for update_id in range(first, cls.next_update)]
+            if not result:
+                time.sleep(0.05)
+        else:
+            with cls.lock:
+                cls.calls += 1
+            time.sleep(cls.latency)
+            if method == 'getMe':
+                result = {
+                    'id': BOT_ID, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot',
+                    'can_join_groups': True, 'can_read_all_group_messages': True,
+                    'supports_inline_queries': False,
+                }
+            elif method == 'getChatMember':
+                user_id = int(params.get('user_id', 0))
+                if user_id == BOT_ID:
+                    status = 'administrator'
+                elif int(params.get('chat_id', 0)) == CHANNEL_ID:
+                    status = 'left'
+                else:
+                    status = 'member'
+                result = {'status': status, 'user': {'id': user_id, 'is_bot': user_id == BOT_ID, 'first_name': 'U'}}
+                if status == 'administrator':
+                    result.update({
+                        'can_be_edited': False, 'is_anonymous': False, 'can_manage_chat': True,
+                        'can_delete_messages': True, 'can_manage_video_chats': True,
+                        'can_restrict_members': True, 'can_promote_members': False,
+                        'can_change_info': True, 'can_invite_users': True,
+                    })
+            elif method == 'sendMessage':
+                with cls.lock:
+                    cls.handled += 1
+                    if cls.handled == cls.total:
+                        cls.finished = time.perf_counter()
+                result = {
+                    'message_id': cls.handled,
+                    'date': int(time.time()),
+                    'chat': {'id': int(params.get('chat_id', 0)), 'type': 'supergroup'},
+                    'text': 'warning',
+                }
+            else:
+                result = True
+
+        body = json.dumps({'ok': True, 'result': result}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The bot was stopped in the middle of a long poll
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+def seed_configs(mongo_uri: str, database: str):
+    from pymongo import MongoClient
+    collection = MongoClient(mongo_uri)[database]['fsub_channels']
+    for chat_id in chat_ids():
+        collection.update_one(
+            {'chat_id': chat_id},
+            {'$set': {'channel': CHANNEL, 'channel_id': CHANNEL_ID, 'unmute_delay': 0}},
+            upsert=True
+        )
+
+def drop_database(mongo_uri: str, database: str):
+    from pymongo import MongoClient
+    MongoClient(mongo_uri).drop_database(database)
+
+def run_once(api_port: int, health_port: int, workers: int, updates: int, timeout: float,
+             mongo_uri: str, database: str):
+    cls = FakeBotApi
+    cls.total = updates
+    cls.next_update = 0
+    cls.started = None
+    cls.finished = None
+    cls.handled = 0
+    cls.calls = 0
+    scratch_dir = tempfile.mkdtemp(prefix='bench_workers_')
+    env = dict(
+        os.environ,
+        BOT_TOKEN=TOKEN,
+        BOT_TOKENS='',
+        BOT_WORKERS=str(workers),
+        PORT=str(health_port),
+        TELEGRAM_API_URL=f"http://127.0.0.1:{api_port}",
+        MONGO_URI=mongo_uri,
+        DATABASE_NAME=database,
+        # Fresh caches for every run, and no traces in the working tree
+        SNAPSHOT_DIR=scratch_dir,
+        TRACE_DIR=scratch_dir,
+        API_RATE_LIMIT='1000000',
+        GROUP_MESSAGES_PER_MINUTE='1000000',
+    )
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bot.py')],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.perf_counter() + timeout
+    try:
+        while cls.finished is None and time.perf_counter() < deadline:
+            time.sleep(0.05)
+    finally:
+        process.terminate()
+        process.wait()
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+    if cls.finished is None:
+        return None
+    return updates / (cls.finished - cls.started), cls.calls / updates
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count())
+    parser.add_argument('--latency', type=float, default=10, help="fake API latency per call in ms")
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--health-port', type=int, default=18001)
+    parser.add_argument('--mongo-uri', default=os.getenv('MONGO_URI'))
+    parser.add_argument('--database', default=f"fsub_bench_{os.getpid()}", help="throwaway database, dropped afterwards")
+    args = parser.parse_args()
+    if not args.mongo_uri:
+        parser.error("--mongo-uri or MONGO_URI is required")
+
+    FakeBotApi.latency = args.latency / 1000
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeBotApi)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    seed_configs(args.mongo_uri, args.database)
+    print(f"{args.updates} updates over {CHATS} groups, {args.latency:.0f} ms API latency, {os.cpu_count()} CPUs")
+    try:
+        baseline = None
+        workers = 1
+        while workers <= max(args.max_workers, 1):
+            result = run_once(
+                server.server_address[1], args.health_port, workers, args.updates, args.timeout,
+                args.mongo_uri, args.database
+            )
+            if result is None:
+                print(f"workers={workers:<3} not finished within {args.timeout:.0f}s ({FakeBotApi.handled} handled)")
+            else:
+                rate, calls = result
+                baseline = baseline or rate
+                print(
+                    f"workers={workers:<3} {rate:10.0f} updates/s  speedup x{rate / baseline:.2f}  "
+                    f"({calls:.1f} API calls per update)"
+                )
+            workers *= 2
+    finally:
+        server.shutdown()
+        drop_database(args.mongo_uri, args.database)
+
+if __name__ == '__main__':
+    main()
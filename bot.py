@@ -1,19 +1,25 @@
 import os
+import json
+import pickle
+import queue
+import random
+import asyncio
+import bisect
+import functools
+import hashlib
+import heapq
+import itertools
+import contextlib
 import logging
+import multiprocessing
+import signal
+import threading
 import time
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from threading import Thread
 from datetime import datetime, timedelta
-from flask import Flask
-from pymongo import MongoClient
-from telegram import Update, ChatPermissions, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import (
-    ApplicationBuilder,
-    ContextTypes,
-    CommandHandler,
-    MessageHandler,
-    filters,
-    CallbackQueryHandler
-)
 
 # Load environment variables
 from dotenv import load_dotenv
@@ -26,25 +32,1251 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# MongoDB setup
-mongo_client = MongoClient(os.getenv('MONGO_URI'))
-db = mongo_client.telegram_bot
-fsub_collection = db.fsub_channels
-user_collection = db.users
+# Readiness signals for staged startup
+storage_ready = threading.Event()
+bot_ready = threading.Event()
+storage_errors = []
+
+class HealthHandler(BaseHTTPRequestHandler):
+    """Liveness on / and readiness on /ready"""
+
+    def do_GET(self):
+        if self.path == '/':
+            self.respond(200, "Bot is running")
+        elif self.path == '/ready':
+            if storage_ready.is_set() and bot_ready.is_set() and not storage_errors:
+                self.respond(200, "Ready")
+            else:
+                self.respond(503, "Starting")
+        else:
+            self.respond(404, "Not found")
+
+    def respond(self, status: int, text: str):
+        body = text.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_health_server():
+    server = ThreadingHTTPServer(('0.0.0.0', int(os.getenv('PORT', 8000))), HealthHandler)
+    Thread(target=server.serve_forever, daemon=True, name='health').start()
+
+# Answer health checks before the slower imports below
+if __name__ == '__main__':
+    start_health_server()
+
+from telegram import Bot, Update, ChatPermissions, InlineKeyboardButton, InlineKeyboardMarkup, MessageEntity
+from telegram.error import InvalidToken, RetryAfter, TelegramError, TimedOut
+from telegram.request import HTTPXRequest
+from telegram.ext import (
+    ApplicationBuilder,
+    BaseRateLimiter,
+    BaseUpdateProcessor,
+    CallbackContext,
+    ContextTypes,
+    CommandHandler,
+    MessageHandler,
+    filters,
+    CallbackQueryHandler
+)
+
+# MongoDB setup, connected lazily so a slow server does not block startup
+DATABASE_NAME = os.getenv('DATABASE_NAME', 'telegram_bot')
+mongo_client = None
+mongo_lock = threading.Lock()
+
+def get_mongo_client():
+    global mongo_client
+    with mongo_lock:
+        if mongo_client is None:
+            from pymongo import MongoClient
+            mongo_client = MongoClient(os.getenv('MONGO_URI'), event_listeners=[mongo_span_listener()])
+        return mongo_client
+
+class LazyCollection:
+    """Collection handle that connects on first use"""
+
+    def __init__(self, database_name: str, name: str):
+        self.database_name = database_name
+        self.name = name
+
+    def __getattr__(self, attribute):
+        return getattr(get_mongo_client()[self.database_name][self.name], attribute)
+
+# Every hosted bot is a tenant with its own database. Handlers reach the
+# active tenant's collections and buffers through these proxies.
+current_tenant = ContextVar('current_tenant', default=None)
+
+class TenantProxy:
+    """Forward attribute access to an attribute of the active tenant"""
+
+    def __init__(self, attribute: str):
+        self.attribute = attribute
+
+    def __getattr__(self, name):
+        return getattr(getattr(active_tenant(), self.attribute), name)
+
+fsub_collection = TenantProxy('fsub_collection')
+user_collection = TenantProxy('user_collection')
+stats_collection = TenantProxy('stats_collection')
+
+# Hot query shapes that must be served by an index
+HOT_QUERIES = [
+    (fsub_collection, {'chat_id': 0}),
+    (user_collection, {'user_id': 0}),
+    (stats_collection, {'scope': 'global', 'bucket': None}),
+]
+
+def plan_uses_index(plan: dict) -> bool:
+    """Walk an explain() winning plan looking for an index scan stage"""
+    if plan.get('stage') in ('IXSCAN', 'IDHACK', 'EXPRESS_IXSCAN', 'COUNT_SCAN', 'DISTINCT_SCAN'):
+        return True
+    children = []
+    if 'inputStage' in plan:
+        children.append(plan['inputStage'])
+    children.extend(plan.get('inputStages', []))
+    if 'queryPlan' in plan:
+        children.append(plan['queryPlan'])
+    return any(plan_uses_index(child) for child in children)
+
+def ensure_unique_index(collection, key: str, name: str):
+    """Create a unique index, or explain what blocks it without failing startup
+
+    Deployments from before the index existed may hold duplicate documents or
+    an index of their own on the same key.
+    """
+    from pymongo.errors import DuplicateKeyError, OperationFailure
+    try:
+        collection.create_index(key, unique=True, name=name)
+        return
+    except DuplicateKeyError:
+        duplicates = list(collection.aggregate([
+            {'$group': {'_id': f"${key}", 'count': {'$sum': 1}}},
+            {'$match': {'count': {'$gt': 1}}},
+            {'$limit': 10},
+        ]))
+        logger.error(
+            f"Cannot create unique index {name} on {collection.name}: duplicate {key} values "
+            f"{[doc['_id'] for doc in duplicates]}. Delete the extra documents for these keys "
+            f"and drop index '{key}_1' to get the unique index; using a non-unique index meanwhile"
+        )
+    except OperationFailure as e:
+        logger.error(
+            f"Cannot create unique index {name} on {collection.name}: {e.details.get('errmsg', e)}. "
+            f"Drop the existing index on {key} (db.{collection.name}.dropIndex(...)) to get the unique index"
+        )
+        return
+    try:
+        # Keep the hot lookup indexed until the duplicates are cleaned up
+        collection.create_index(key, name=f"{key}_1")
+    except OperationFailure as e:
+        logger.error(f"Cannot create fallback index on {collection.name}.{key}: {e}")
+
+def ensure_indexes():
+    """Create required indexes and verify hot queries use them"""
+    # Unique keys back the per-message config lookup, the /start upsert and
+    # the distinct() scans used by broadcasts
+    ensure_unique_index(fsub_collection, 'chat_id', 'chat_id_unique')
+    ensure_unique_index(user_collection, 'user_id', 'user_id_unique')
+    stats_collection.create_index([('scope', 1), ('bucket', 1)], unique=True, name='scope_bucket_unique')
+    # Hourly buckets expire; the per-scope totals document has bucket=None and is kept
+    stats_collection.create_index(
+        'bucket',
+        expireAfterSeconds=STATS_RETENTION_DAYS * 86400,
+        name='bucket_ttl'
+    )
+
+    for collection, query in HOT_QUERIES:
+        explain = collection.find(query).explain()
+        winning_plan = explain.get('queryPlanner', {}).get('winningPlan', {})
+        if not plan_uses_index(winning_plan):
+            raise RuntimeError(
+                f"Query {list(query)} on {collection.name} is not using an index: {winning_plan}"
+            )
+    logger.info("MongoDB indexes verified")
 
-# Flask app for health checks
-app = Flask(__name__)
+def prepare_storage(tenants, provision: bool = True):
+    """Connect to MongoDB with backoff, then provision indexes"""
+    delay = 1
+    while True:
+        try:
+            get_mongo_client().admin.command('ping')
+            break
+        except Exception as e:
+            logger.warning(f"MongoDB not reachable yet, retrying in {delay}s: {e}")
+            time.sleep(delay)
+            delay = min(delay * 2, 30)
+    try:
+        if provision:
+            for tenant in tenants:
+                with tenant_scope(tenant):
+                    ensure_indexes()
+    except Exception as e:
+        storage_errors.append(e)
+    storage_ready.set()
+    logger.info("MongoDB ready")
 
-@app.route('/')
-def health_check():
-    return "Bot is running", 200
+def start_storage(tenants, provision: bool = True):
+    Thread(target=prepare_storage, args=(tenants, provision), daemon=True, name='mongo-connect').start()
 
-def run_flask():
-    app.run(host='0.0.0.0', port=8000)
+async def wait_for_storage():
+    """Block until MongoDB is usable; index problems still fail startup"""
+    # Poll instead of parking an executor thread, which would block exit
+    while not storage_ready.is_set():
+        await asyncio.sleep(0.1)
+    if storage_errors:
+        raise storage_errors[0]
 
 # Global variables for bot stats
 BOT_START_TIME = time.time()
 
+# Write-behind settings for user tracking
+USER_FLUSH_MAX = int(os.getenv('USER_FLUSH_MAX', 500))
+USER_FLUSH_INTERVAL = float(os.getenv('USER_FLUSH_INTERVAL', 5))
+USER_BUFFER_MAX_PENDING = int(os.getenv('USER_BUFFER_MAX_PENDING', 50000))
+
+class UserUpsertBuffer:
+    """Coalesce user profile upserts by user_id and write them with bulk_write"""
+
+    def __init__(self, collection, max_size: int, interval: float, max_pending: int = USER_BUFFER_MAX_PENDING):
+        self.collection = collection
+        self.max_size = max_size
+        self.interval = interval
+        self.max_pending = max_pending
+        self.pending = {}
+        self.lock = asyncio.Lock()
+        self.flush_task = None
+        self.dropped = 0
+        self.flush_count = 0
+        self.written_total = 0
+        self.last_flush_size = 0
+        self.last_flush_ms = 0.0
+
+    def add(self, user_id: int, fields: dict):
+        # Later updates for the same user replace earlier ones in the same interval
+        if user_id not in self.pending and len(self.pending) >= self.max_pending:
+            # Mongo is behind or down; don't let the buffer grow without bound
+            if not self.dropped:
+                logger.warning(f"User upsert buffer full ({self.max_pending}), dropping new users")
+            self.dropped += 1
+            return
+        self.pending[user_id] = fields
+        if len(self.pending) >= self.max_size and not self.lock.locked():
+            # Keep a reference, the event loop only holds tasks weakly
+            if self.flush_task is None or self.flush_task.done():
+                self.flush_task = asyncio.get_running_loop().create_task(self.flush())
+
+    async def flush(self):
+        # Size-triggered flushes start inside a handler; keep them out of its trace
+        with tracer.detached():
+            await self._flush()
+
+    async def _flush(self):
+        from pymongo import UpdateOne
+        async with self.lock:
+            if not self.pending:
+                return
+            batch, self.pending = self.pending, {}
+            operations = [
+                UpdateOne({'user_id': user_id}, {'$set': fields}, upsert=True)
+                for user_id, fields in batch.items()
+            ]
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(self.collection.bulk_write, operations, ordered=False)
+            except Exception as e:
+                logger.error(f"User upsert flush failed ({len(batch)} users): {e}")
+                # Put the batch back unless a newer update arrived meanwhile
+                for user_id, fields in batch.items():
+                    if user_id not in self.pending and len(self.pending) >= self.max_pending:
+                        self.dropped += 1
+                        continue
+                    self.pending.setdefault(user_id, fields)
+                if self.dropped:
+                    logger.warning(f"User upsert buffer full, {self.dropped} updates dropped so far")
+                return
+            self.last_flush_ms = (time.perf_counter() - started) * 1000
+            self.last_flush_size = len(batch)
+            self.flush_count += 1
+            self.written_total += len(batch)
+            if self.dropped:
+                logger.warning(f"User upsert buffer recovered after dropping {self.dropped} updates")
+                self.dropped = 0
+            logger.info(f"Flushed {len(batch)} user upserts in {self.last_flush_ms:.1f} ms")
+
+user_buffer = TenantProxy('user_buffer')
+
+async def flush_user_buffer(context: ContextTypes.DEFAULT_TYPE):
+    """Periodic flush of buffered user upserts"""
+    await user_buffer.flush()
+
+# Statistics settings
+STATS_FLUSH_INTERVAL = float(os.getenv('STATS_FLUSH_INTERVAL', 30))
+STATS_BUCKET_SECONDS = 3600
+STATS_RETENTION_DAYS = int(os.getenv('STATS_RETENTION_DAYS', 30))
+STATS_COUNTERS = ('mutes', 'unmutes', 'broadcast_sent', 'api_errors', 'flood_waits')
+GLOBAL_SCOPE = 'global'
+
+class StatsRecorder:
+    """Count events in memory and persist them as batched $inc writes
+
+    Each scope (``'global'`` or a group's chat_id) has one document per
+    hourly bucket plus a totals document with ``bucket=None``.
+    """
+
+    def __init__(self, collection, bucket_seconds: int):
+        self.collection = collection
+        self.bucket_seconds = bucket_seconds
+        self.pending = {}
+        self.inflight = {}
+        self.recent = {}
+        # Persisted totals per scope, loaded on first use and refreshed on flush
+        self.persisted = {}
+        self.lock = asyncio.Lock()
+        self.groups_estimate = 0
+        self.users_estimate = 0
+        self.mongo_ok = False
+
+    def current_bucket(self) -> int:
+        return int(time.time()) // self.bucket_seconds * self.bucket_seconds
+
+    def incr(self, counter: str, chat_id: int = None, amount: int = 1):
+        bucket = self.current_bucket()
+        scopes = [GLOBAL_SCOPE] if chat_id is None else [GLOBAL_SCOPE, chat_id]
+        for scope in scopes:
+            pending = self.pending.setdefault(scope, {}).setdefault(bucket, {})
+            pending[counter] = pending.get(counter, 0) + amount
+            recent = self.recent.setdefault(scope, {}).setdefault(bucket, {})
+            recent[counter] = recent.get(counter, 0) + amount
+
+    def rates(self, scope) -> dict:
+        """Per-hour rates over the current and previous bucket"""
+        now = time.time()
+        bucket = self.current_bucket()
+        buckets = self.recent.get(scope, {})
+        window_start = max(bucket - self.bucket_seconds, BOT_START_TIME)
+        window = max(now - window_start, 60)
+        rates = {}
+        for counter in STATS_COUNTERS:
+            count = sum(
+                buckets.get(b, {}).get(counter, 0)
+                for b in (bucket - self.bucket_seconds, bucket)
+            )
+            rates[counter] = count * 3600 / window
+        return rates
+
+    async def load_totals(self, scope):
+        """Read a scope's persisted totals once; flush() keeps them current"""
+        if scope in self.persisted:
+            return
+        try:
+            doc = await asyncio.to_thread(self.collection.find_one, {'scope': scope, 'bucket': None}) or {}
+        except Exception as e:
+            logger.error(f"Stats totals load failed: {e}")
+            return
+        self.persisted.setdefault(scope, {counter: doc.get(counter, 0) for counter in STATS_COUNTERS})
+
+    def totals(self, scope) -> dict:
+        """Cached persisted totals plus anything not flushed yet"""
+        totals = dict(self.persisted.get(scope, {}))
+        for batch in (self.inflight, self.pending):
+            for counters in batch.get(scope, {}).values():
+                for counter, value in counters.items():
+                    totals[counter] = totals.get(counter, 0) + value
+        return {counter: totals.get(counter, 0) for counter in STATS_COUNTERS}
+
+    async def flush(self):
+        from pymongo import UpdateOne
+        async with self.lock:
+            batch, self.pending = self.pending, {}
+            self.inflight = batch
+            operations = []
+            for scope, buckets in batch.items():
+                scope_total = {}
+                for bucket, counters in buckets.items():
+                    operations.append(UpdateOne(
+                        {'scope': scope, 'bucket': datetime.utcfromtimestamp(bucket)},
+                        {'$inc': counters},
+                        upsert=True
+                    ))
+                    for counter, value in counters.items():
+                        scope_total[counter] = scope_total.get(counter, 0) + value
+                operations.append(UpdateOne(
+                    {'scope': scope, 'bucket': None},
+                    {'$inc': scope_total},
+                    upsert=True
+                ))
+            try:
+                if operations:
+                    await asyncio.to_thread(self.collection.bulk_write, operations, ordered=False)
+                self.inflight = {}
+                for scope, buckets in batch.items():
+                    if scope in self.persisted:
+                        for counters in buckets.values():
+                            for counter, value in counters.items():
+                                self.persisted[scope][counter] = self.persisted[scope].get(counter, 0) + value
+                if self.persisted:
+                    # Re-read so totals include writes from other workers too
+                    docs = await asyncio.to_thread(
+                        lambda: list(self.collection.find({'scope': {'$in': list(self.persisted)}, 'bucket': None}))
+                    )
+                    for doc in docs:
+                        self.persisted[doc['scope']] = {counter: doc.get(counter, 0) for counter in STATS_COUNTERS}
+                self.groups_estimate = await asyncio.to_thread(fsub_collection.estimated_document_count)
+                self.users_estimate = await asyncio.to_thread(user_collection.estimated_document_count)
+                self.mongo_ok = True
+            except Exception as e:
+                logger.error(f"Stats flush failed: {e}")
+                self.mongo_ok = False
+                if not self.inflight:
+                    # Written already, only the refresh failed
+                    batch = {}
+                self.inflight = {}
+                for scope, buckets in batch.items():
+                    for bucket, counters in buckets.items():
+                        pending = self.pending.setdefault(scope, {}).setdefault(bucket, {})
+                        for counter, value in counters.items():
+                            pending[counter] = pending.get(counter, 0) + value
+
+            # Rates only need the current and previous bucket
+            oldest = self.current_bucket() - self.bucket_seconds
+            for scope in list(self.recent):
+                buckets = self.recent[scope]
+                for bucket in [b for b in buckets if b < oldest]:
+                    del buckets[bucket]
+                if not buckets:
+                    del self.recent[scope]
+
+stats = TenantProxy('stats')
+
+# Enforcement cache settings
+CONFIG_CACHE_TTL = int(os.getenv('CONFIG_CACHE_TTL', 300))
+ADMIN_CACHE_TTL = int(os.getenv('ADMIN_CACHE_TTL', 600))
+MEMBER_CACHE_TTL = int(os.getenv('MEMBER_CACHE_TTL', 300))
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 200000))
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', '.')
+SNAPSHOT_INTERVAL = int(os.getenv('SNAPSHOT_INTERVAL', 300))
+SNAPSHOT_VERSION = 1
+AUDIT_WINDOW = int(os.getenv('AUDIT_WINDOW', 3 * 86400))
+MISSING = object()
+
+class TtlCache:
+    """Dictionary whose entries expire ``ttl`` seconds after they were set,
+    or after the ttl passed to set() for that entry
+
+    Expiry uses wall-clock time so entries stay meaningful across restarts.
+    """
+
+    def __init__(self, ttl: int, max_entries: int = CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[0] > time.time():
+                self.hits += 1
+                return entry[1]
+            del self.entries[key]
+        self.misses += 1
+        return default
+
+    def set(self, key, value, ttl: float = None):
+        if len(self.entries) >= self.max_entries:
+            self.prune()
+        self.entries[key] = (time.time() + (self.ttl if ttl is None else ttl), value)
+
+    def live_items(self):
+        """(key, expires_at, value) for every unexpired entry"""
+        now = time.time()
+        return [(key, expires, value) for key, (expires, value) in self.entries.items() if expires > now]
+
+    def pop(self, key):
+        self.entries.pop(key, None)
+
+    def pop_where(self, predicate) -> int:
+        """Drop every entry whose key matches, returning how many went"""
+        keys = [key for key in self.entries if predicate(key)]
+        for key in keys:
+            del self.entries[key]
+        return len(keys)
+
+    def prune(self):
+        now = time.time()
+        self.entries = {key: entry for key, entry in self.entries.items() if entry[0] > now}
+        if len(self.entries) >= self.max_entries:
+            # Still full of live entries: keep the half that lives longest
+            keep = sorted(self.entries.items(), key=lambda item: item[1][0])[len(self.entries) // 2:]
+            self.entries = dict(keep)
+
+    def load(self, entries: dict) -> int:
+        now = time.time()
+        self.entries = {key: entry for key, entry in entries.items() if entry[0] > now}
+        return len(self.entries)
+
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+config_cache = TenantProxy('config_cache')
+admin_cache = TenantProxy('admin_cache')
+member_cache = TenantProxy('member_cache')
+permission_cache = TenantProxy('permission_cache')
+speaker_cache = TenantProxy('speaker_cache')
+
+CACHE_NAMES = ('config_cache', 'admin_cache', 'member_cache', 'permission_cache', 'speaker_cache')
+
+class Tenant:
+    """Storage, write buffers and caches of one hosted bot"""
+
+    def __init__(self, database_name: str):
+        self.database_name = database_name
+        self.fsub_collection = LazyCollection(database_name, 'fsub_channels')
+        self.user_collection = LazyCollection(database_name, 'users')
+        self.stats_collection = LazyCollection(database_name, 'stats')
+        self.user_buffer = UserUpsertBuffer(self.user_collection, USER_FLUSH_MAX, USER_FLUSH_INTERVAL)
+        self.stats = StatsRecorder(self.stats_collection, STATS_BUCKET_SECONDS)
+        # Group fsub settings, user status in the group, user status in the
+        # channel and the bot's own status in the channel
+        self.config_cache = TtlCache(CONFIG_CACHE_TTL)
+        self.admin_cache = TtlCache(ADMIN_CACHE_TTL)
+        self.member_cache = TtlCache(MEMBER_CACHE_TTL)
+        self.permission_cache = TtlCache(ADMIN_CACHE_TTL)
+        # Who spoke recently in each group, for /fsub audit
+        self.speaker_cache = TtlCache(AUDIT_WINDOW)
+        self.snapshot_path = os.path.join(SNAPSHOT_DIR, f"snapshot_{database_name}.pickle")
+
+    def snapshot(self) -> dict:
+        """Copy all caches into a picklable snapshot"""
+        # Copy on the event loop thread, handlers keep mutating the caches
+        return {
+            'version': SNAPSHOT_VERSION,
+            'saved_at': time.time(),
+            'caches': {name: dict(getattr(self, name).entries) for name in CACHE_NAMES},
+        }
+
+    def write_snapshot(self, snapshot: dict):
+        """Atomically replace the snapshot file"""
+        temp_path = f"{self.snapshot_path}.tmp"
+        with open(temp_path, 'wb') as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self.snapshot_path)
+
+    def load_snapshot(self):
+        """Restore unexpired cache entries from the snapshot file"""
+        try:
+            with open(self.snapshot_path, 'rb') as f:
+                snapshot = pickle.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable snapshot {self.snapshot_path}: {e}")
+            return
+        if snapshot.get('version') != SNAPSHOT_VERSION:
+            return
+        loaded = {
+            name: getattr(self, name).load(snapshot['caches'].get(name, {}))
+            for name in CACHE_NAMES
+        }
+        age = time.time() - snapshot['saved_at']
+        logger.info(f"Loaded cache snapshot from {age:.0f}s ago: {loaded}")
+
+default_tenant = Tenant(DATABASE_NAME)
+
+def active_tenant() -> Tenant:
+    return current_tenant.get() or default_tenant
+
+@contextlib.contextmanager
+def tenant_scope(tenant: Tenant):
+    token = current_tenant.set(tenant)
+    try:
+        yield
+    finally:
+        current_tenant.reset(token)
+
+class TenantContext(CallbackContext):
+    """Callback context that activates the tenant of its application
+
+    Every update and job runs in its own task, so the tenant set here stays
+    active for the rest of that handler or job.
+    """
+
+    @classmethod
+    def from_update(cls, update, application):
+        current_tenant.set(application.bot_data['tenant'])
+        return super().from_update(update, application)
+
+    @classmethod
+    def from_job(cls, job, application):
+        current_tenant.set(application.bot_data['tenant'])
+        return super().from_job(job, application)
+
+    @classmethod
+    def from_error(cls, update, error, application, job=None, coroutine=None):
+        current_tenant.set(application.bot_data['tenant'])
+        return super().from_error(update, error, application, job=job, coroutine=coroutine)
+
+async def flush_stats(context: ContextTypes.DEFAULT_TYPE):
+    """Periodic flush of buffered statistics"""
+    await stats.flush()
+
+async def save_snapshot(tenant: Tenant):
+    try:
+        await asyncio.to_thread(tenant.write_snapshot, tenant.snapshot())
+    except Exception as e:
+        logger.error(f"Could not write cache snapshot: {e}")
+
+async def snapshot_caches(context: ContextTypes.DEFAULT_TYPE):
+    """Periodic cache snapshot for warm restarts"""
+    await save_snapshot(active_tenant())
+
+async def on_startup(application):
+    """Restore cached state and prime counts so /status has numbers right away"""
+    tenant = application.bot_data['tenant']
+    await asyncio.to_thread(tenant.load_snapshot)
+    await wait_for_storage()
+    with tenant_scope(tenant):
+        await stats.flush()
+    bot_ready.set()
+
+async def on_shutdown(application):
+    """Flush pending writes before the process exits"""
+    tenant = application.bot_data['tenant']
+    with tenant_scope(tenant):
+        await user_buffer.flush()
+        await stats.flush()
+    await save_snapshot(tenant)
+
+def get_fsub_config(chat_id: int):
+    """Group fsub settings, served from cache when possible"""
+    fsub_data = config_cache.get(chat_id, MISSING)
+    if fsub_data is MISSING:
+        fsub_data = fsub_collection.find_one({'chat_id': chat_id})
+        config_cache.set(chat_id, fsub_data)
+    return fsub_data
+
+# Tracing settings
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', 0))
+TRACE_SLOW_MS = float(os.getenv('TRACE_SLOW_MS', 5000))
+TRACE_DIR = os.getenv('TRACE_DIR', 'traces')
+TRACE_MAX_BYTES = int(os.getenv('TRACE_MAX_BYTES', 10 * 1024 * 1024))
+TRACE_BACKUP_COUNT = int(os.getenv('TRACE_BACKUP_COUNT', 5))
+
+current_trace = ContextVar('current_trace', default=None)
+
+class Trace:
+    """Spans recorded while one update is handled"""
+
+    def __init__(self, name: str, attributes: dict):
+        self.trace_id = os.urandom(8).hex()
+        self.name = name
+        self.attributes = attributes
+        self.started = time.time()
+        self.started_perf = time.perf_counter()
+        self.spans = []
+
+    def add_span(self, name: str, started_perf: float, duration_ms: float, attributes: dict = None, error: str = None):
+        span = {
+            'name': name,
+            'start_ms': round((started_perf - self.started_perf) * 1000, 3),
+            'duration_ms': round(duration_ms, 3),
+        }
+        if attributes:
+            span['attributes'] = attributes
+        if error:
+            span['error'] = error
+        self.spans.append(span)
+
+class Tracer:
+    """Record update traces and write the sampled or slow ones as JSONL
+
+    Writes go through a queue to a rotating file on a background thread so
+    handlers never wait on disk.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger('bot.traces')
+        self.logger.propagate = False
+        self.listener = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.listener is not None
+
+    def configure(self, filename: str):
+        if self.enabled or (TRACE_SAMPLE_RATE <= 0 and TRACE_SLOW_MS <= 0):
+            return
+        os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+        handler = RotatingFileHandler(
+            filename,
+            maxBytes=TRACE_MAX_BYTES,
+            backupCount=TRACE_BACKUP_COUNT,
+            encoding='utf-8'
+        )
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        records = queue.SimpleQueue()
+        self.logger.addHandler(QueueHandler(records))
+        self.logger.setLevel(logging.INFO)
+        self.listener = QueueListener(records, handler)
+        self.listener.start()
+
+    def shutdown(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def start(self, name: str, attributes: dict, queued_ms: float = 0.0):
+        """Begin a trace in the current task; returns a token for finish()
+
+        ``queued_ms`` is how long the update waited for a worker. The trace is
+        backdated to its arrival and the wait becomes a leading span.
+        """
+        if not self.enabled:
+            return None
+        trace = Trace(name, attributes)
+        if queued_ms > 0:
+            trace.started -= queued_ms / 1000
+            trace.started_perf -= queued_ms / 1000
+            trace.add_span('scheduler.queue', trace.started_perf, queued_ms)
+        trace.attributes['queued_ms'] = round(queued_ms, 3)
+        return current_trace.set(trace)
+
+    def finish(self, token):
+        if token is None:
+            return
+        trace = current_trace.get()
+        current_trace.reset(token)
+        duration_ms = (time.perf_counter() - trace.started_perf) * 1000
+        slow = TRACE_SLOW_MS > 0 and duration_ms >= TRACE_SLOW_MS
+        if not slow and random.random() >= TRACE_SAMPLE_RATE:
+            return
+        self.logger.info(json.dumps({
+            'trace_id': trace.trace_id,
+            'name': trace.name,
+            'start': trace.started,
+            'duration_ms': round(duration_ms, 3),
+            'slow': slow,
+            'attributes': trace.attributes,
+            'spans': trace.spans,
+        }, default=str))
+
+    @contextlib.contextmanager
+    def detached(self):
+        """Run background work outside the trace of the update that spawned it"""
+        token = current_trace.set(None)
+        try:
+            yield
+        finally:
+            current_trace.reset(token)
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attributes):
+        """Time a block as a child span of the current trace
+
+        Yields the attribute dict so the block can add to it.
+        """
+        trace = current_trace.get()
+        if trace is None:
+            yield attributes
+            return
+        started = time.perf_counter()
+        error = None
+        try:
+            yield attributes
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            trace.add_span(name, started, (time.perf_counter() - started) * 1000, attributes, error)
+
+tracer = Tracer()
+
+def mongo_span_listener():
+    """Command listener that records MongoDB calls as spans"""
+    from pymongo import monitoring
+
+    class MongoSpanListener(monitoring.CommandListener):
+        def __init__(self):
+            self.pending = {}
+
+        def started(self, event):
+            trace = current_trace.get()
+            if trace is not None:
+                collection = event.command.get(event.command_name)
+                name = f"mongo.{event.command_name}"
+                if isinstance(collection, str):
+                    name = f"{name} {collection}"
+                self.pending[event.request_id] = (trace, name, time.perf_counter())
+
+        def succeeded(self, event):
+            self.finish(event)
+
+        def failed(self, event):
+            self.finish(event, error=str(event.failure.get('codeName', 'error')))
+
+        def finish(self, event, error=None):
+            pending = self.pending.pop(event.request_id, None)
+            if pending is not None:
+                trace, name, started = pending
+                trace.add_span(name, started, event.duration_micros / 1000, error=error)
+
+    return MongoSpanListener()
+
+def update_trace_name(update) -> str:
+    if not isinstance(update, Update):
+        return 'update'
+    if update.callback_query:
+        return 'update.callback_query'
+    message = update.effective_message
+    if message and message.text and message.text.startswith('/'):
+        return f"update.command {message.text.split()[0].split('@')[0]}"
+    return 'update.message'
+
+# Bot API rate governor settings
+API_RATE_LIMIT = float(os.getenv('API_RATE_LIMIT', 30))
+GROUP_MESSAGES_PER_MINUTE = float(os.getenv('GROUP_MESSAGES_PER_MINUTE', 20))
+PRIVATE_MESSAGES_PER_SECOND = float(os.getenv('PRIVATE_MESSAGES_PER_SECOND', 1))
+# Part of API_RATE_LIMIT kept for broadcasts when running several workers
+WORKER_BROADCAST_SHARE = float(os.getenv('WORKER_BROADCAST_SHARE', 0.3))
+
+# Lower value is served first
+PRIORITY_CALLBACK = 0
+PRIORITY_MUTE = 1
+PRIORITY_CLEANUP = 2
+PRIORITY_BROADCAST = 3
+PRIORITY_AUDIT = 4
+
+# How long a request may keep waiting and retrying before it is given up
+PRIORITY_DEADLINES = {
+    PRIORITY_CALLBACK: 10,
+    PRIORITY_MUTE: 120,
+    PRIORITY_CLEANUP: 600,
+    PRIORITY_BROADCAST: 3600,
+    PRIORITY_AUDIT: 600,
+}
+
+ENDPOINT_PRIORITIES = {
+    'answerCallbackQuery': PRIORITY_CALLBACK,
+    'deleteMessage': PRIORITY_CLEANUP,
+    'copyMessage': PRIORITY_BROADCAST,
+    'pinChatMessage': PRIORITY_BROADCAST,
+}
+
+# Only message-producing calls count against Telegram's per-chat limits
+PER_CHAT_ENDPOINTS = {
+    'sendMessage', 'copyMessage', 'forwardMessage', 'editMessageText', 'pinChatMessage',
+}
+
+api_priority = ContextVar('api_priority', default=None)
+chat_no_wait = ContextVar('chat_no_wait', default=False)
+
+class ChatBusy(Exception):
+    """A send was skipped because its chat is at Telegram's per-chat limit"""
+
+@contextlib.contextmanager
+def skip_if_chat_busy():
+    """Fail sends with ChatBusy instead of waiting for the chat's bucket"""
+    token = chat_no_wait.set(True)
+    try:
+        yield
+    finally:
+        chat_no_wait.reset(token)
+
+def with_priority(priority: int):
+    """Run a handler with a default priority for the Bot API calls it makes"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            token = api_priority.set(priority)
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                api_priority.reset(token)
+        return wrapper
+    return decorator
+
+class TokenBucket:
+    """Refill `rate` tokens per second up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def delay(self) -> float:
+        """Seconds until a token can be taken"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.blocked_until - now)
+
+    def take(self):
+        self.tokens -= 1
+
+    def try_take(self) -> bool:
+        if self.delay() > 0:
+            return False
+        self.take()
+        return True
+
+    def block(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        while True:
+            wait = self.delay()
+            if wait <= 0:
+                self.take()
+                return
+            await asyncio.sleep(wait)
+
+class RateGovernor(BaseRateLimiter[int]):
+    """Pace every Bot API request through global and per-chat token buckets
+
+    Requests waiting for the global bucket are released in priority order,
+    so a flood of low-priority work delays broadcasts instead of mutes and
+    callback answers. ``RetryAfter`` pauses the affected bucket and the
+    request is retried until its priority's deadline runs out. With a
+    ``broadcast_bucket`` set, broadcast requests are paced by it alone.
+    """
+
+    def __init__(self, overall_rate: float, group_per_minute: float, private_per_second: float):
+        self.global_bucket = TokenBucket(overall_rate, overall_rate)
+        self.group_rate = group_per_minute / 60
+        self.private_rate = private_per_second
+        self.chat_buckets = {}
+        self.broadcast_bucket = None
+        self.waiters = []
+        self.sequence = itertools.count()
+        self.wakeup = asyncio.Event()
+        self.pump_task = None
+
+    async def initialize(self):
+        if self.pump_task is None:
+            self.pump_task = asyncio.create_task(self._pump())
+
+    async def shutdown(self):
+        if self.pump_task is not None:
+            self.pump_task.cancel()
+            self.pump_task = None
+        for _, _, future in self.waiters:
+            if not future.done():
+                future.cancel()
+        self.waiters.clear()
+
+    def queue_depth(self) -> int:
+        return len(self.waiters)
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) > 10000:
+                # Drop idle buckets; a full bucket carries no state worth keeping
+                for key in [k for k, b in self.chat_buckets.items() if b.delay() <= 0 and b.tokens >= b.capacity]:
+                    del self.chat_buckets[key]
+            if isinstance(chat_id, int) and chat_id > 0:
+                bucket = TokenBucket(self.private_rate, 1)
+            else:
+                bucket = TokenBucket(self.group_rate, 3)
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def _pump(self):
+        while True:
+            if not self.waiters:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+            wait = self.global_bucket.delay()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            _, _, future = heapq.heappop(self.waiters)
+            if future.done():
+                # The caller gave up while waiting
+                continue
+            self.global_bucket.take()
+            future.set_result(None)
+
+    async def _acquire(self, priority: int, chat_bucket):
+        if chat_bucket is not None:
+            if chat_no_wait.get():
+                if not chat_bucket.try_take():
+                    raise ChatBusy()
+            else:
+                await chat_bucket.acquire()
+        if priority == PRIORITY_BROADCAST and self.broadcast_bucket is not None:
+            await self.broadcast_bucket.acquire()
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.sequence), future))
+        self.wakeup.set()
+        await future
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        if rate_limit_args is not None:
+            priority = rate_limit_args
+        elif endpoint == 'answerCallbackQuery':
+            priority = PRIORITY_CALLBACK
+        elif api_priority.get() is not None:
+            priority = api_priority.get()
+        else:
+            priority = ENDPOINT_PRIORITIES.get(endpoint, PRIORITY_MUTE)
+
+        chat_id = data.get('chat_id')
+        chat_bucket = self._chat_bucket(chat_id) if endpoint in PER_CHAT_ENDPOINTS and chat_id else None
+        deadline = time.monotonic() + PRIORITY_DEADLINES[priority]
+
+        with tracer.span(f"bot.{endpoint}", chat_id=chat_id, priority=priority) as span:
+            span['queued_ms'] = 0.0
+            span['attempts'] = 0
+            while True:
+                remaining = deadline - time.monotonic()
+                queued = time.perf_counter()
+                try:
+                    await asyncio.wait_for(self._acquire(priority, chat_bucket), timeout=max(remaining, 0))
+                except asyncio.TimeoutError:
+                    raise TimedOut(f"{endpoint} was not sent within {PRIORITY_DEADLINES[priority]}s") from None
+                finally:
+                    span['queued_ms'] = round(span['queued_ms'] + (time.perf_counter() - queued) * 1000, 3)
+
+                span['attempts'] += 1
+                try:
+                    return await callback(*args, **kwargs)
+                except RetryAfter as e:
+                    retry_after = float(e.retry_after)
+                    stats.incr('flood_waits', chat_id if isinstance(chat_id, int) else None)
+                    if time.monotonic() + retry_after > deadline:
+                        logger.error(f"{endpoint} to {chat_id} dropped: retry after {retry_after}s exceeds deadline")
+                        raise
+                    logger.warning(f"{endpoint} to {chat_id} hit flood control, retrying in {retry_after}s")
+                    if chat_bucket is None and priority == PRIORITY_BROADCAST and self.broadcast_bucket is not None:
+                        self.broadcast_bucket.block(retry_after)
+                    else:
+                        (chat_bucket or self.global_bucket).block(retry_after)
+
+rate_governor = RateGovernor(API_RATE_LIMIT, GROUP_MESSAGES_PER_MINUTE, PRIVATE_MESSAGES_PER_SECOND)
+
+# Update scheduling settings
+UPDATE_WORKERS = int(os.getenv('UPDATE_WORKERS', 8))
+UPDATE_QUEUE_SIZE = int(os.getenv('UPDATE_QUEUE_SIZE', 1000))
+DUPLICATE_WINDOW = float(os.getenv('DUPLICATE_WINDOW', 10))
+
+UPDATE_PRIORITY_INTERACTIVE = 0
+UPDATE_PRIORITY_ENFORCEMENT = 1
+UPDATE_PRIORITY_DUPLICATE = 2
+
+UPDATE_PRIORITY_NAMES = {
+    UPDATE_PRIORITY_INTERACTIVE: 'interactive',
+    UPDATE_PRIORITY_ENFORCEMENT: 'enforcement',
+    UPDATE_PRIORITY_DUPLICATE: 'duplicate',
+}
+
+# Commands registered in build_application; anything else starting with / is a plain message
+BOT_COMMANDS = frozenset({
+    'start', 'help', 'fsub', 'disconnect', 'setdelay', 'getdelay', 'status', 'stats', 'broadcast',
+})
+
+class PriorityUpdateProcessor(BaseUpdateProcessor):
+    """Run updates on a fixed number of workers, picking waiting updates by priority
+
+    Callback queries and commands go first, the first message from a user
+    in a chat next, and repeat messages from the same user within
+    DUPLICATE_WINDOW last. When the wait queue is full the lowest priority
+    update is dropped. Updates from the same user in the same chat never
+    run at the same time, they are handled one after another.
+    """
+
+    def __init__(self, workers: int, queue_size: int):
+        self.users = 0
+        # Leave headroom above running plus queued updates so new arrivals
+        # always reach the shedding logic instead of waiting on the semaphore
+        super().__init__(2 * workers + queue_size)
+        self.workers = workers
+        self.queue_size = queue_size
+        self.active = 0
+        self.waiters = []
+        self.busy_lanes = set()
+        self.sequence = itertools.count()
+        self.last_seen = {}
+        self.shed_count = 0
+        self.wait_avg_ms = {priority: 0.0 for priority in UPDATE_PRIORITY_NAMES}
+        self.wait_max_ms = 0.0
+
+    async def initialize(self):
+        self.users += 1
+
+    async def shutdown(self):
+        # Hosted tenants share one processor; only the last one to stop drops
+        # what is still queued
+        self.users = max(self.users - 1, 0)
+        if self.users:
+            return
+        for _, _, _, future, _ in self.waiters:
+            if not future.done():
+                future.set_result(False)
+        self.waiters.clear()
+
+    def queue_depth(self) -> int:
+        return len(self.waiters)
+
+    def classify(self, update) -> int:
+        if not isinstance(update, Update):
+            return UPDATE_PRIORITY_ENFORCEMENT
+        if update.callback_query:
+            return UPDATE_PRIORITY_INTERACTIVE
+        if self.is_command(update.effective_message):
+            return UPDATE_PRIORITY_INTERACTIVE
+
+        key = self.lane(update)
+        if key is None:
+            return UPDATE_PRIORITY_ENFORCEMENT
+
+        now = time.monotonic()
+        last = self.last_seen.get(key)
+        self.last_seen[key] = now
+        if len(self.last_seen) > 50000:
+            for old_key in [k for k, seen in self.last_seen.items() if now - seen > DUPLICATE_WINDOW]:
+                del self.last_seen[old_key]
+        if last is not None and now - last < DUPLICATE_WINDOW:
+            return UPDATE_PRIORITY_DUPLICATE
+        return UPDATE_PRIORITY_ENFORCEMENT
+
+    @staticmethod
+    def is_command(message) -> bool:
+        """True for a message that starts with one of our registered commands"""
+        if not message or not message.text or not message.entities:
+            return False
+        entity = message.entities[0]
+        if entity.type != MessageEntity.BOT_COMMAND or entity.offset != 0:
+            return False
+        command, _, username = message.text[1:entity.length].partition('@')
+        if username:
+            try:
+                if username.lower() != message.get_bot().username.lower():
+                    return False
+            except RuntimeError:
+                pass
+        return command.lower() in BOT_COMMANDS
+
+    @staticmethod
+    def lane(update):
+        """Updates sharing a lane are processed one at a time"""
+        if not isinstance(update, Update):
+            return None
+        chat = update.effective_chat
+        user = update.effective_user
+        if not chat or not user:
+            return None
+        # Hosted bots share this processor and each gets its own copy of a
+        # group message, so the bot is part of the key
+        try:
+            bot_id = update.get_bot().id
+        except RuntimeError:
+            bot_id = None
+        return (bot_id, chat.id, user.id)
+
+    def _record_wait(self, priority: int, waited_ms: float):
+        self.wait_avg_ms[priority] = self.wait_avg_ms[priority] * 0.9 + waited_ms * 0.1
+        self.wait_max_ms = max(self.wait_max_ms, waited_ms)
+
+    def _shed(self, coroutine):
+        coroutine.close()
+        self.shed_count += 1
+
+    async def do_process_update(self, update, coroutine):
+        priority = self.classify(update)
+        lane = self.lane(update)
+
+        if self.active < self.workers and lane not in self.busy_lanes:
+            self.active += 1
+            if lane is not None:
+                self.busy_lanes.add(lane)
+            queued_ms = 0.0
+        else:
+            if len(self.waiters) >= self.queue_size:
+                worst = max(self.waiters)
+                if worst[0] <= priority:
+                    self._shed(coroutine)
+                    return
+                # Make room by dropping the lowest priority, newest waiter
+                self.waiters.remove(worst)
+                heapq.heapify(self.waiters)
+                worst[3].set_result(False)
+                # The dropped waiter may have been the only one on a free slot
+                self._dispatch()
+
+            enqueued = time.monotonic()
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self.waiters, (priority, next(self.sequence), enqueued, future, lane))
+            if not await future:
+                self._shed(coroutine)
+                return
+            # _dispatch already counted this update in self.active and its lane
+            queued_ms = (time.monotonic() - enqueued) * 1000
+        self._record_wait(priority, queued_ms)
+
+        chat = update.effective_chat if isinstance(update, Update) else None
+        user = update.effective_user if isinstance(update, Update) else None
+        trace = tracer.start(update_trace_name(update), {
+            'chat_id': chat.id if chat else None,
+            'user_id': user.id if user else None,
+            'priority': UPDATE_PRIORITY_NAMES[priority],
+        }, queued_ms)
+        try:
+            await coroutine
+        finally:
+            tracer.finish(trace)
+            self._release(lane)
+
+    def _release(self, lane):
+        self.active -= 1
+        self.busy_lanes.discard(lane)
+        self._dispatch()
+
+    def _next_waiter(self):
+        """Highest priority waiter whose lane is free"""
+        while self.waiters and self.waiters[0][3].done():
+            heapq.heappop(self.waiters)
+        if not self.waiters:
+            return None
+        if self.waiters[0][4] not in self.busy_lanes:
+            return self.waiters[0]
+        for entry in sorted(self.waiters):
+            if not entry[3].done() and entry[4] not in self.busy_lanes:
+                return entry
+        return None
+
+    def _dispatch(self):
+        """Hand free worker slots to waiting updates"""
+        while self.active < self.workers:
+            entry = self._next_waiter()
+            if entry is None:
+                return
+            if entry is self.waiters[0]:
+                heapq.heappop(self.waiters)
+            else:
+                self.waiters.remove(entry)
+                heapq.heapify(self.waiters)
+            self.active += 1
+            if entry[4] is not None:
+                self.busy_lanes.add(entry[4])
+            entry[3].set_result(True)
+
+update_processor = PriorityUpdateProcessor(UPDATE_WORKERS, UPDATE_QUEUE_SIZE)
+
+@with_priority(PRIORITY_CLEANUP)
 async def delete_previous_warnings(chat_id: int, user_id: int, context: ContextTypes.DEFAULT_TYPE):
     """Delete all previous warning messages for a user"""
     if 'user_warnings' not in context.chat_data:
@@ -62,6 +1294,7 @@ async def delete_previous_warnings(chat_id: int, user_id: int, context: ContextT
             )
         except Exception as e:
             logger.warning(f"Could not delete message {msg_id}: {e}")
+            stats.incr('api_errors', chat_id)
     
     if user_id in context.chat_data['user_warnings']:
         del context.chat_data['user_warnings'][user_id]
@@ -69,16 +1302,12 @@ async def delete_previous_warnings(chat_id: int, user_id: int, context: ContextT
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_chat.type == 'private':
         user = update.effective_user
-        user_collection.update_one(
-            {'user_id': user.id},
-            {'$set': {
-                'first_name': user.first_name,
-                'last_name': user.last_name,
-                'username': user.username,
-                'last_interaction': datetime.now()
-            }},
-            upsert=True
-        )
+        user_buffer.add(user.id, {
+            'first_name': user.first_name,
+            'last_name': user.last_name,
+            'username': user.username,
+            'last_interaction': datetime.now()
+        })
     
     keyboard = [
         [
@@ -151,9 +1380,11 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/start - Introduction\n"
         "/help - This message\n"
         "/fsub [@channel|ID|reply] - Set required channel\n"
+        "/fsub audit - Re-check recent speakers against the channel\n"
         "/disconnect - Stop forcing subscription\n"
         "/setdelay [seconds] - Set unmute delay (0 or ≥30 allowed)\n"
-        "/getdelay - Show current unmute delay\n\n"
+        "/getdelay - Show current unmute delay\n"
+        "/stats - Show mute/unmute activity for this group\n\n"
         "I'll mute anyone who hasn't joined the required channel for 5 minutes."
     )
     
@@ -175,6 +1406,10 @@ async def set_fsub_channel(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Only admins can use this command.")
         return
     
+    if context.args and context.args[0].lower() == 'audit':
+        await start_group_audit(update, context)
+        return
+    
     if update.message.reply_to_message and update.message.reply_to_message.sender_chat:
         if update.message.reply_to_message.sender_chat.type == 'channel':
             channel = update.message.reply_to_message.sender_chat.username or str(update.message.reply_to_message.sender_chat.id)
@@ -207,6 +1442,7 @@ async def save_fsub_channel(chat_id: int, channel: str, update: Update, context:
             await update.message.reply_text("❌ The specified chat is not a channel.")
             return
         
+        previous = get_fsub_config(chat_id)
         fsub_collection.update_one(
             {'chat_id': chat_id},
             {'$set': {
@@ -216,6 +1452,11 @@ async def save_fsub_channel(chat_id: int, channel: str, update: Update, context:
             }},
             upsert=True
         )
+        config_cache.pop(chat_id)
+        if previous and previous.get('channel_id') != chat.id:
+            # Audit verdicts were for the old channel
+            old_targets = {previous.get('channel_id'), f"@{previous.get('channel')}", previous.get('channel')}
+            member_cache.pop_where(lambda key: key[0] in old_targets)
         
         try:
             bot_member = await context.bot.get_chat_member(chat.id, context.bot.id)
@@ -245,6 +1486,143 @@ async def save_fsub_channel(chat_id: int, channel: str, update: Update, context:
             "3. You provided a valid channel identifier"
         )
 
+# Group audit settings
+AUDIT_MAX_USERS = int(os.getenv('AUDIT_MAX_USERS', 500))
+AUDIT_BATCH_SIZE = int(os.getenv('AUDIT_BATCH_SIZE', 10))
+AUDIT_PROGRESS_INTERVAL = 5
+# How long the audit's "joined" verdicts are trusted. Capped, since a user who
+# leaves the channel in the meantime can keep talking until it runs out
+AUDIT_MEMBER_TTL = min(int(os.getenv('AUDIT_MEMBER_TTL', 1800)), 3600)
+
+def recent_speakers(chat_id: int) -> list:
+    """Users seen in a group within AUDIT_WINDOW, most recent first"""
+    speakers = [
+        (expires, key[1])
+        for key, expires, _ in speaker_cache.live_items()
+        if key[0] == chat_id
+    ]
+    speakers.sort(reverse=True)
+    return [user_id for _, user_id in speakers[:AUDIT_MAX_USERS]]
+
+async def start_group_audit(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat = update.effective_chat
+    
+    if context.chat_data.get('audit_running'):
+        await update.message.reply_text("⏳ An audit is already running in this group.")
+        return
+    # Claim the audit before the first await, updates for a chat run concurrently
+    context.chat_data['audit_running'] = True
+    started = False
+    
+    try:
+        fsub_data = get_fsub_config(chat.id)
+        if not fsub_data:
+            await update.message.reply_text("❌ Force subscription is not set for this group. Use /fsub first.")
+            return
+        
+        channel = fsub_data.get('channel')
+        channel_id = fsub_data.get('channel_id')
+        target_chat = channel_id if channel_id else (f"@{channel}" if channel and not channel.startswith('-') else channel)
+        
+        try:
+            bot_member = await context.bot.get_chat_member(target_chat, context.bot.id)
+            if bot_member.status not in ['administrator', 'creator']:
+                await update.message.reply_text("⚠️ I need admin in the channel to check memberships.")
+                return
+        except Exception as e:
+            logger.error(f"Permission check error: {e}")
+            await update.message.reply_text("⚠️ I can't check my permissions in that channel.")
+            return
+        
+        user_ids = [
+            user_id for user_id in recent_speakers(chat.id)
+            if admin_cache.get((chat.id, user_id)) not in ['administrator', 'creator']
+        ]
+        if not user_ids:
+            await update.message.reply_text("ℹ️ No recent speakers to audit in this group yet.")
+            return
+        
+        progress_msg = await update.message.reply_text(f"🔍 Auditing {len(user_ids)} recent members...")
+        # Run in the background so this update does not hold a worker slot
+        context.application.create_task(
+            audit_group(chat.id, target_chat, user_ids, progress_msg, context),
+            update=update
+        )
+        started = True
+    finally:
+        if not started:
+            context.chat_data['audit_running'] = False
+
+@with_priority(PRIORITY_AUDIT)
+async def audit_group(chat_id: int, target_chat, user_ids: list, progress_msg, context: ContextTypes.DEFAULT_TYPE):
+    """Re-verify channel membership of recent speakers in throttled batches
+
+    Results go into the membership cache: joined users are pre-approved for
+    AUDIT_MEMBER_TTL and the rest are muted without another API call if they
+    speak within MEMBER_CACHE_TTL; older "not joined" verdicts are re-checked.
+    """
+    # Runs as its own task; the command's trace is already written, so don't
+    # keep adding spans to it
+    with tracer.detached():
+        joined = 0
+        not_joined = 0
+        failed = 0
+        last_progress = time.monotonic()
+    
+        async def verify(user_id):
+            chat_member = await context.bot.get_chat_member(target_chat, user_id)
+            if chat_member.status in ['left', 'kicked']:
+                # Someone may join right after the audit, so don't trust this for long
+                member_cache.set((target_chat, user_id), chat_member.status)
+            else:
+                member_cache.set((target_chat, user_id), chat_member.status, ttl=AUDIT_MEMBER_TTL)
+            return chat_member.status
+    
+        try:
+            for start_index in range(0, len(user_ids), AUDIT_BATCH_SIZE):
+                batch = user_ids[start_index:start_index + AUDIT_BATCH_SIZE]
+                results = await asyncio.gather(*(verify(user_id) for user_id in batch), return_exceptions=True)
+                for result in results:
+                    if isinstance(result, Exception):
+                        logger.warning(f"Audit check failed in {chat_id}: {result}")
+                        failed += 1
+                    elif result in ['left', 'kicked']:
+                        not_joined += 1
+                    else:
+                        joined += 1
+            
+                checked = start_index + len(batch)
+                if checked < len(user_ids) and time.monotonic() - last_progress >= AUDIT_PROGRESS_INTERVAL:
+                    last_progress = time.monotonic()
+                    try:
+                        await progress_msg.edit_text(
+                            f"🔍 Auditing {len(user_ids)} recent members...\n"
+                            f"• Checked: {checked}/{len(user_ids)} ({checked / len(user_ids) * 100:.1f}%)\n"
+                            f"• Joined: {joined}\n"
+                            f"• Not joined: {not_joined}"
+                        )
+                    except Exception as e:
+                        logger.error(f"Audit progress update failed: {e}")
+        
+            report_text = (
+                f"✅ Audit completed!\n\n"
+                f"• Members checked: {len(user_ids)}\n"
+                f"• Joined (pre-approved): {joined}\n"
+                f"• Not joined: {not_joined}"
+            )
+            if failed:
+                report_text += f"\n• Failed checks: {failed}"
+            report_text += (
+                f"\n\nJoined members are trusted for the next {AUDIT_MEMBER_TTL // 60} min; "
+                f"the rest are checked again after {MEMBER_CACHE_TTL // 60} min."
+            )
+            await progress_msg.edit_text(report_text)
+        except Exception as e:
+            logger.error(f"Audit failed in {chat_id}: {e}")
+            stats.incr('api_errors', chat_id)
+        finally:
+            context.chat_data['audit_running'] = False
+
 async def disconnect_fsub(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat = update.effective_chat
     user = update.effective_user
@@ -266,6 +1644,7 @@ async def disconnect_fsub(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Remove the fsub entry from database
     result = fsub_collection.delete_one({'chat_id': chat.id})
+    config_cache.pop(chat.id)
     
     if result.deleted_count > 0:
         await update.message.reply_text(
@@ -321,6 +1700,7 @@ async def set_unmute_delay(update: Update, context: ContextTypes.DEFAULT_TYPE):
             {'chat_id': chat.id},
             {'$set': {'unmute_delay': delay}}
         )
+        config_cache.pop(chat.id)
         
         if delay == 0:
             await update.message.reply_text(
@@ -363,6 +1743,7 @@ async def get_unmute_delay(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "⚠️ Only 0 or numbers ≥30 are allowed!"
         )
 
+@with_priority(PRIORITY_MUTE)
 async def check_membership(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.message and update.message.forward_from_chat and update.message.forward_from_chat.type == 'channel':
         return
@@ -383,7 +1764,9 @@ async def check_membership(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if current_time - message_time > 10:
             return
     
-    fsub_data = fsub_collection.find_one({'chat_id': chat.id})
+    speaker_cache.set((chat.id, user.id), True)
+    
+    fsub_data = get_fsub_config(chat.id)
     if not fsub_data:
         return
     
@@ -391,8 +1774,12 @@ async def check_membership(update: Update, context: ContextTypes.DEFAULT_TYPE):
     channel_id = fsub_data.get('channel_id')
     
     try:
-        member = await chat.get_member(user.id)
-        if member.status in ['administrator', 'creator']:
+        member_status = admin_cache.get((chat.id, user.id))
+        if member_status is None:
+            member = await chat.get_member(user.id)
+            member_status = member.status
+            admin_cache.set((chat.id, user.id), member_status)
+        if member_status in ['administrator', 'creator']:
             return
         
         target_chat = channel_id if channel_id else (f"@{channel}" if channel and not channel.startswith('-') else channel)
@@ -402,8 +1789,12 @@ async def check_membership(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
         
         try:
-            bot_member = await context.bot.get_chat_member(target_chat, context.bot.id)
-            if bot_member.status not in ['administrator', 'creator']:
+            bot_status = permission_cache.get(target_chat)
+            if bot_status is None:
+                bot_member = await context.bot.get_chat_member(target_chat, context.bot.id)
+                bot_status = bot_member.status
+                permission_cache.set(target_chat, bot_status)
+            if bot_status not in ['administrator', 'creator']:
                 last_warning = context.chat_data.get('last_channel_warning', 0)
                 current_time = time.time()
                 if current_time - last_warning > 3600:
@@ -415,10 +1806,20 @@ async def check_membership(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 return
         except Exception as perm_error:
             logger.error(f"Permission check error: {perm_error}")
+            stats.incr('api_errors', chat.id)
             return
         
-        chat_member = await context.bot.get_chat_member(target_chat, user.id)
-        if chat_member.status in ['left', 'kicked']:
+        channel_status = member_cache.get((target_chat, user.id))
+        if channel_status is None:
+            chat_member = await context.bot.get_chat_member(target_chat, user.id)
+            channel_status = chat_member.status
+            # Only joined users are cached so leavers are caught on their next message
+            if channel_status not in ['left', 'kicked']:
+                member_cache.set((target_chat, user.id), channel_status)
+        elif channel_status in ['left', 'kicked']:
+            # A pre-mute verdict from /fsub audit is used once, then re-checked
+            member_cache.pop((target_chat, user.id))
+        if channel_status in ['left', 'kicked']:
             permissions = ChatPermissions(
                 can_send_messages=False,
                 can_send_audios=False,
@@ -444,6 +1845,7 @@ async def check_membership(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     permissions,
                     until_date=until_date
                 )
+                stats.incr('mutes', chat.id)
                 
                 await delete_previous_warnings(chat.id, user.id, context)
                 
@@ -497,13 +1899,25 @@ async def check_membership(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 else:
                     channel_display = "the required channel"
                 
-                warning_msg = await update.message.reply_text(
-                    f"⚠️ {user.mention_html()} has been muted for 5 minutes.\n"
-                    f"Reason: Not joined {channel_display}\n\n"
-                    "After joining, click 'Unmute Me' to verify membership.",
-                    parse_mode='HTML',
-                    reply_markup=reply_markup
-                )
+                try:
+                    # In a flooded group the per-chat send limit would park this
+                    # worker for minutes; the mute stands, the warning is skipped
+                    with skip_if_chat_busy():
+                        warning_msg = await update.message.reply_text(
+                            f"⚠️ {user.mention_html()} has been muted for 5 minutes.\n"
+                            f"Reason: Not joined {channel_display}\n\n"
+                            "After joining, click 'Unmute Me' to verify membership.",
+                            parse_mode='HTML',
+                            reply_markup=reply_markup
+                        )
+                except ChatBusy:
+                    logger.info(f"Skipped mute warning in {chat.id}: chat send limit reached")
+                    return
+                except Exception as warning_error:
+                    # The user is muted already; this is not a permission problem
+                    logger.warning(f"Mute warning not sent in {chat.id}: {warning_error}")
+                    stats.incr('api_errors', chat.id)
+                    return
                 
                 if 'user_warnings' not in context.chat_data:
                     context.chat_data['user_warnings'] = {}
@@ -517,6 +1931,7 @@ async def check_membership(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 
             except Exception as mute_error:
                 logger.error(f"Error muting user: {mute_error}")
+                stats.incr('api_errors', chat.id)
                 last_mute_error = context.chat_data.get('last_mute_error', 0)
                 current_time = time.time()
                 if current_time - last_mute_error > 3600:
@@ -527,7 +1942,9 @@ async def check_membership(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     except Exception as e:
         logger.error(f"Error in membership check: {e}")
+        stats.incr('api_errors', chat.id)
 
+@with_priority(PRIORITY_CALLBACK)
 async def unmute_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -544,7 +1961,7 @@ async def unmute_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     try:
-        fsub_data = fsub_collection.find_one({'chat_id': chat_id})
+        fsub_data = get_fsub_config(chat_id)
         if not fsub_data:
             await query.answer("❌ Configuration error. Please contact admin.", show_alert=True)
             return
@@ -559,6 +1976,7 @@ async def unmute_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
         
         try:
+            # Always ask Telegram here: the user has just joined
             chat_member = await context.bot.get_chat_member(target_chat, user_id)
             if chat_member.status in ['left', 'kicked']:
                 await query.answer(
@@ -566,8 +1984,10 @@ async def unmute_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     show_alert=True
                 )
                 return
+            member_cache.set((target_chat, user_id), chat_member.status)
         except Exception as e:
             logger.error(f"Error verifying membership: {e}")
+            stats.incr('api_errors', chat_id)
             await query.answer(
                 "⚠️ Error verifying membership. Please try again later.",
                 show_alert=True
@@ -630,6 +2050,7 @@ async def unmute_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
     except Exception as e:
         logger.error(f"Error in unmute process: {e}")
+        stats.incr('api_errors', chat_id)
         await query.answer(
             "⚠️ Failed to process unmute request. Please contact an admin.",
             show_alert=True
@@ -672,10 +2093,13 @@ async def complete_unmute_immediately(chat_id, user_id, context):
                 permissions=permissions,
                 until_date=datetime.now() + timedelta(seconds=1)  # Set to 1 second in future
             )
+        stats.incr('unmutes', chat_id)
             
     except Exception as e:
         logger.error(f"Error unmuting user immediately: {e}")
+        stats.incr('api_errors', chat_id)
 
+@with_priority(PRIORITY_MUTE)
 async def complete_unmute_after_delay(context: ContextTypes.DEFAULT_TYPE):
     """Complete unmute after delay"""
     job_data = context.job.data
@@ -717,9 +2141,49 @@ async def complete_unmute_after_delay(context: ContextTypes.DEFAULT_TYPE):
                 permissions=permissions,
                 until_date=datetime.now() + timedelta(seconds=1)  # Set to 1 second in future
             )
+        stats.incr('unmutes', chat_id)
             
     except Exception as e:
         logger.error(f"Error unmuting user after delay: {e}")
+        stats.incr('api_errors', chat_id)
+
+STATS_LABELS = {
+    'mutes': 'Mutes',
+    'unmutes': 'Unmutes',
+    'broadcast_sent': 'Broadcast Sends',
+    'api_errors': 'API Errors',
+    'flood_waits': 'Flood Waits',
+}
+
+async def format_counters(scope) -> str:
+    """Render totals and hourly rates for a stats scope"""
+    await stats.load_totals(scope)
+    totals = stats.totals(scope)
+    rates = stats.rates(scope)
+    lines = ["📈 *Activity* (total | per hour)"]
+    for counter in STATS_COUNTERS:
+        if scope != GLOBAL_SCOPE and counter == 'broadcast_sent':
+            continue
+        lines.append(f"• {STATS_LABELS[counter]}: `{totals[counter]}` | `{rates[counter]:.1f}/h`")
+    return "\n".join(lines)
+
+async def group_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat = update.effective_chat
+    user = update.effective_user
+    
+    if chat.type == 'private':
+        await update.message.reply_text("This command only works in groups.")
+        return
+    
+    member = await chat.get_member(user.id)
+    if member.status not in ['administrator', 'creator']:
+        await update.message.reply_text("❌ Only admins can use this command.")
+        return
+    
+    await update.message.reply_text(
+        f"📊 *Group Stats*\n\n{await format_counters(chat.id)}",
+        parse_mode='Markdown'
+    )
 
 async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if str(update.effective_user.id) != os.getenv('OWNER_ID'):
@@ -729,18 +2193,31 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     uptime_seconds = time.time() - BOT_START_TIME
     uptime = str(timedelta(seconds=int(uptime_seconds)))
     
-    groups_count = fsub_collection.count_documents({})
-    users_count = user_collection.count_documents({})
-    bot_info = await context.bot.get_me()
-    mongo_status = "Connected" if mongo_client.server_info() else "Disconnected"
+    bot_info = context.bot.bot
+    wait_summary = " / ".join(
+        f"{UPDATE_PRIORITY_NAMES[priority]} {wait:.0f}"
+        for priority, wait in update_processor.wait_avg_ms.items()
+    )
+    cache_summary = " / ".join(
+        f"{name.split('_')[0]} {getattr(active_tenant(), name).hit_rate():.0%}"
+        for name in CACHE_NAMES
+    )
+    mongo_status = "Connected" if stats.mongo_ok else "Disconnected"
     
     status_text = (
         f"🤖 *Bot Status Report*\n\n"
         f"• Bot Name: [{bot_info.full_name}](t.me/{bot_info.username})\n"
         f"• Uptime: `{uptime}`\n"
-        f"• Groups Using: `{groups_count}`\n"
-        f"• Users Tracked: `{users_count}`\n"
-        f"• MongoDB: `{mongo_status}`\n\n"
+        f"• Groups Using: `~{stats.groups_estimate}`\n"
+        f"• Users Tracked: `~{stats.users_estimate}`\n"
+        f"• MongoDB: `{mongo_status}`\n"
+        f"• Pending User Writes: `{len(user_buffer.pending)}`\n"
+        f"• Last User Flush: `{user_buffer.last_flush_size}` in `{user_buffer.last_flush_ms:.1f} ms`\n"
+        f"• API Queue Depth: `{context.bot.rate_limiter.queue_depth()}`\n"
+        f"• Update Queue Depth: `{update_processor.queue_depth()}` (shed `{update_processor.shed_count}`)\n"
+        f"• Update Wait (avg ms): `{wait_summary}` (max `{update_processor.wait_max_ms:.0f}`)\n"
+        f"• Cache Hit Rate: `{cache_summary}`\n\n"
+        f"{await format_counters(GLOBAL_SCOPE)}\n\n"
         f"📊 *System Stats*\n"
         f"• Python Version: `{os.sys.version.split()[0]}`\n"
         f"• Platform: `{os.sys.platform}`"
@@ -778,6 +2255,7 @@ async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup=reply_markup
     )
 
+@with_priority(PRIORITY_CALLBACK)
 async def broadcast_target_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -796,6 +2274,7 @@ async def broadcast_target_callback(update: Update, context: ContextTypes.DEFAUL
         reply_markup=reply_markup
     )
 
+@with_priority(PRIORITY_BROADCAST)
 async def broadcast_pin_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -817,6 +2296,7 @@ async def broadcast_pin_callback(update: Update, context: ContextTypes.DEFAULT_T
         recipients.extend([('group', gid) for gid in groups])
     
     if target in ['users', 'both']:
+        await user_buffer.flush()
         users = user_collection.distinct("user_id")
         recipients.extend([('user', uid) for uid in users])
     
@@ -830,66 +2310,133 @@ async def broadcast_pin_callback(update: Update, context: ContextTypes.DEFAULT_T
         f"• Sent: 0\n"
         f"• Failed: 0"
     )
+    # Run in the background so the owner's chat and a worker slot stay free
+    context.application.create_task(
+        run_broadcast(recipients, msg_info, pin_option, progress_msg, query.message.chat_id, context),
+        update=update
+    )
 
-    successful = 0
-    failed = 0
-    failed_ids = []
+@with_priority(PRIORITY_BROADCAST)
+async def run_broadcast(recipients: list, msg_info: dict, pin_option: str, progress_msg, report_chat_id: int, context: ContextTypes.DEFAULT_TYPE):
+    # The callback's trace is already written; don't keep adding spans to it
+    with tracer.detached():
+        total = len(recipients)
+        successful = 0
+        failed = 0
+        failed_ids = []
     
-    for idx, (recipient_type, recipient_id) in enumerate(recipients):
-        try:
-            sent_msg = await context.bot.copy_message(
-                chat_id=recipient_id,
-                from_chat_id=msg_info['chat_id'],
-                message_id=msg_info['message_id']
-            )
-            
-            if recipient_type == 'group' and pin_option == 'yes':
-                try:
-                    await context.bot.pin_chat_message(
-                        chat_id=recipient_id,
-                        message_id=sent_msg.message_id
-                    )
-                except Exception as pin_error:
-                    logger.error(f"Pin failed in {recipient_id}: {pin_error}")
-            
-            successful += 1
-        except Exception as e:
-            logger.error(f"Broadcast failed to {recipient_type} {recipient_id}: {e}")
-            failed += 1
-            failed_ids.append(recipient_id)
-        
-        if (idx + 1) % 10 == 0 or (idx + 1) == total:
+        for idx, (recipient_type, recipient_id) in enumerate(recipients):
             try:
-                await progress_msg.edit_text(
-                    f"📢 Broadcasting to {total} recipients...\n"
-                    f"• Sent: {successful}\n"
-                    f"• Failed: {failed}\n"
-                    f"• Progress: {idx+1}/{total} ({((idx+1)/total)*100:.1f}%)"
+                sent_msg = await context.bot.copy_message(
+                    chat_id=recipient_id,
+                    from_chat_id=msg_info['chat_id'],
+                    message_id=msg_info['message_id']
                 )
+            
+                if recipient_type == 'group' and pin_option == 'yes':
+                    try:
+                        await context.bot.pin_chat_message(
+                            chat_id=recipient_id,
+                            message_id=sent_msg.message_id
+                        )
+                    except Exception as pin_error:
+                        logger.error(f"Pin failed in {recipient_id}: {pin_error}")
+            
+                successful += 1
+                stats.incr('broadcast_sent')
             except Exception as e:
-                logger.error(f"Progress update failed: {e}")
+                logger.error(f"Broadcast failed to {recipient_type} {recipient_id}: {e}")
+                stats.incr('api_errors')
+                failed += 1
+                failed_ids.append(recipient_id)
+        
+            if (idx + 1) % 10 == 0 or (idx + 1) == total:
+                try:
+                    await progress_msg.edit_text(
+                        f"📢 Broadcasting to {total} recipients...\n"
+                        f"• Sent: {successful}\n"
+                        f"• Failed: {failed}\n"
+                        f"• Progress: {idx+1}/{total} ({((idx+1)/total)*100:.1f}%)"
+                    )
+                except Exception as e:
+                    logger.error(f"Progress update failed: {e}")
     
-    report_text = (
-        f"✅ Broadcast completed!\n\n"
-        f"• Total recipients: {total}\n"
-        f"• Successful: {successful}\n"
-        f"• Failed: {failed}"
-    )
+        report_text = (
+            f"✅ Broadcast completed!\n\n"
+            f"• Total recipients: {total}\n"
+            f"• Successful: {successful}\n"
+            f"• Failed: {failed}"
+        )
     
-    if failed > 0:
-        report_text += f"\n\n❌ Failed IDs:\n{', '.join(map(str, failed_ids[:10]))}"
-        if failed > 10:
-            report_text += f"\n... and {failed-10} more"
+        if failed > 0:
+            report_text += f"\n\n❌ Failed IDs:\n{', '.join(map(str, failed_ids[:10]))}"
+            if failed > 10:
+                report_text += f"\n... and {failed-10} more"
     
-    await context.bot.send_message(
-        chat_id=query.message.chat_id,
-        text=report_text
-    )
+        await context.bot.send_message(
+            chat_id=report_chat_id,
+            text=report_text
+        )
 
-def main():
-    Thread(target=run_flask, daemon=True).start()
-    
-    application = ApplicationBuilder().token(os.getenv('BOT_TOKEN')).build()
+# Multi-worker settings
+BOT_WORKERS = int(os.getenv('BOT_WORKERS', 1))
+WORKER_POLL_TIMEOUT = 5
+HASH_RING_REPLICAS = 100
+
+class HashRing:
+    """Consistent hash ring mapping routing keys to worker indexes"""
+
+    def __init__(self, nodes, replicas: int = HASH_RING_REPLICAS):
+        self.ring = sorted(
+            (self.hash_key(f"{node}:{replica}"), node)
+            for node in nodes
+            for replica in range(replicas)
+        )
+        self.keys = [point for point, _ in self.ring]
+
+    @staticmethod
+    def hash_key(key) -> int:
+        return int.from_bytes(hashlib.md5(str(key).encode()).digest()[:8], 'big')
+
+    def node_for(self, key):
+        index = bisect.bisect(self.keys, self.hash_key(key)) % len(self.keys)
+        return self.ring[index][1]
+
+def routing_key(update: Update):
+    """Chat that owns an update, so its state stays on one worker"""
+    if update.effective_chat:
+        return update.effective_chat.id
+    if update.effective_user:
+        return update.effective_user.id
+    return update.update_id
+
+# Optional self-hosted Bot API server, e.g. http://localhost:8081
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', '').rstrip('/')
+
+def build_application(
+    token: str = None,
+    tenant: Tenant = default_tenant,
+    limiter: RateGovernor = rate_governor,
+    request: HTTPXRequest = None,
+    receive_updates: bool = True
+):
+    builder = (
+        ApplicationBuilder()
+        .token(token or os.getenv('BOT_TOKEN'))
+        .context_types(ContextTypes(context=TenantContext))
+        .rate_limiter(limiter)
+        .concurrent_updates(update_processor)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+    )
+    if request is not None:
+        builder = builder.request(request)
+    if TELEGRAM_API_URL:
+        builder = builder.base_url(f"{TELEGRAM_API_URL}/bot")
+    if not receive_updates:
+        builder = builder.updater(None)
+    application = builder.build()
+    application.bot_data['tenant'] = tenant
     
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_command))
@@ -898,6 +2445,7 @@ def main():
     application.add_handler(CommandHandler("setdelay", set_unmute_delay))
     application.add_handler(CommandHandler("getdelay", get_unmute_delay))
     application.add_handler(CommandHandler("status", status_command))
+    application.add_handler(CommandHandler("stats", group_stats_command))
     application.add_handler(CommandHandler("broadcast", broadcast_command))
     application.add_handler(
         MessageHandler(filters.ChatType.GROUPS & ~filters.StatusUpdate.ALL, check_membership)
@@ -906,7 +2454,213 @@ def main():
     application.add_handler(CallbackQueryHandler(broadcast_target_callback, pattern=r"^bcast_target:"))
     application.add_handler(CallbackQueryHandler(broadcast_pin_callback, pattern=r"^bcast_pin:"))
     
-    application.run_polling()
+    application.job_queue.run_repeating(flush_user_buffer, interval=USER_FLUSH_INTERVAL)
+    application.job_queue.run_repeating(flush_stats, interval=STATS_FLUSH_INTERVAL)
+    application.job_queue.run_repeating(snapshot_caches, interval=SNAPSHOT_INTERVAL)
+    
+    return application
+
+async def serve_worker(application, updates):
+    """Feed updates from the receiver into this worker's application"""
+    receiver = multiprocessing.parent_process()
+    async with application:
+        await on_startup(application)
+        await application.start()
+        while True:
+            try:
+                data = await asyncio.to_thread(updates.get, True, WORKER_POLL_TIMEOUT)
+            except queue.Empty:
+                # Workers ignore signals, so notice a receiver that died hard
+                if receiver is not None and not receiver.is_alive():
+                    logger.error("Receiver process is gone, stopping worker")
+                    break
+                continue
+            if data is None:
+                break
+            await application.update_queue.put(Update.de_json(data, application.bot))
+        await application.stop()
+        await on_shutdown(application)
+
+def run_worker(index: int, worker_count: int, queue):
+    """Entry point of a worker process"""
+    # The receiver stops workers through the queue so pending updates drain
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    # Workers split Telegram's global limit, per-chat limits stay local.
+    # A broadcast runs on the worker owning the chat it was started from, so
+    # it gets a fixed reserve instead of 1/N of the budget. Broadcasts come
+    # from the owner's chat, so normally one worker at a time uses it.
+    broadcast_rate = max(API_RATE_LIMIT * WORKER_BROADCAST_SHARE, 1)
+    share = max((API_RATE_LIMIT - broadcast_rate) / worker_count, 1)
+    rate_governor.global_bucket = TokenBucket(share, share)
+    rate_governor.broadcast_bucket = TokenBucket(broadcast_rate, broadcast_rate)
+    # Each worker owns different chats, so each keeps its own snapshot
+    default_tenant.snapshot_path = os.path.join(SNAPSHOT_DIR, f"snapshot_{DATABASE_NAME}_worker{index}.pickle")
+    start_storage([default_tenant], provision=False)
+    tracer.configure(os.path.join(TRACE_DIR, f"traces_worker{index}.jsonl"))
+    logger.info(f"Worker {index} started")
+    asyncio.run(serve_worker(build_application(receive_updates=False), queue))
+    tracer.shutdown()
+    logger.info(f"Worker {index} stopped")
+
+async def receive_updates(queues):
+    """Long-poll Telegram and hand each update to the worker owning its chat"""
+    ring = HashRing(range(len(queues)))
+    offset = 0
+    base_url = f"{TELEGRAM_API_URL}/bot" if TELEGRAM_API_URL else "https://api.telegram.org/bot"
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    stopping = asyncio.create_task(stop.wait())
+    await wait_for_storage()
+    async with Bot(os.getenv('BOT_TOKEN'), base_url=base_url) as bot:
+        bot_ready.set()
+        delay = 1
+        while not stop.is_set():
+            poll = asyncio.create_task(bot.get_updates(
+                offset=offset,
+                timeout=30,
+                allowed_updates=Update.ALL_TYPES
+            ))
+            await asyncio.wait({poll, stopping}, return_when=asyncio.FIRST_COMPLETED)
+            if not poll.done():
+                poll.cancel()
+                break
+            try:
+                updates = poll.result()
+            except InvalidToken:
+                raise
+            except TelegramError as e:
+                # Conflict during a deploy, flood control and network errors all pass
+                wait = float(e.retry_after) if isinstance(e, RetryAfter) else delay
+                logger.warning(f"Polling failed, retrying in {wait:.0f}s: {e}")
+                await asyncio.wait({stopping}, timeout=wait)
+                delay = min(delay * 2, 30)
+                continue
+            delay = 1
+            for update in updates:
+                offset = update.update_id + 1
+                queues[ring.node_for(routing_key(update))].put(update.to_dict())
+        
+        # Confirm what was handed to workers so a restart doesn't deliver it again
+        if offset:
+            try:
+                await bot.get_updates(offset=offset, timeout=0)
+            except TelegramError as e:
+                logger.warning(f"Could not acknowledge updates up to {offset}: {e}")
+    stopping.cancel()
+
+def run_receiver(worker_count: int):
+    context = multiprocessing.get_context('spawn')
+    queues = [context.Queue() for _ in range(worker_count)]
+    workers = [
+        context.Process(target=run_worker, args=(index, worker_count, queue), name=f"bot-worker-{index}")
+        for index, queue in enumerate(queues)
+    ]
+    for worker in workers:
+        worker.start()
+    
+    try:
+        asyncio.run(receive_updates(queues))
+    finally:
+        for queue in queues:
+            queue.put(None)
+        for worker in workers:
+            worker.join()
+
+# Multi-tenant settings
+BOT_TOKENS = [token.strip() for token in os.getenv('BOT_TOKENS', '').split(',') if token.strip()]
+TENANT_POOL_SIZE = int(os.getenv('TENANT_POOL_SIZE', 64))
+
+class SharedRequest(HTTPXRequest):
+    """Connection pool used by several bots, closed once with close()"""
+
+    async def shutdown(self):
+        # Bot.shutdown() of one tenant must not close the pool under the others
+        pass
+
+    async def close(self):
+        await super().shutdown()
+
+def tenant_database(token: str):
+    """Database name of a hosted bot, namespaced by its bot id"""
+    # Keep the original database for the primary bot so its data carries over
+    if token == os.getenv('BOT_TOKEN'):
+        return DATABASE_NAME
+    return f"{DATABASE_NAME}_{token.split(':')[0]}"
+
+async def run_tenants(tokens):
+    """Host one Application per token on this event loop"""
+    # All tenants share the Mongo client, the HTTP pool for API calls and the
+    # update workers; each keeps its own long-poll connection and rate limits
+    shared_request = SharedRequest(connection_pool_size=TENANT_POOL_SIZE)
+    tenants = [Tenant(tenant_database(token)) for token in tokens]
+    start_storage(tenants)
+    applications = []
+    for token, tenant in zip(tokens, tenants):
+        applications.append(build_application(
+            token,
+            tenant=tenant,
+            limiter=RateGovernor(API_RATE_LIMIT, GROUP_MESSAGES_PER_MINUTE, PRIVATE_MESSAGES_PER_SECOND),
+            request=shared_request
+        ))
+    
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    
+    started = []
+    try:
+        for token, application in zip(tokens, applications):
+            try:
+                await application.initialize()
+            except Exception as e:
+                # One bad token must not keep the other bots from running
+                logger.error(f"Tenant {token.split(':')[0]} failed to start, skipping it: {e}")
+                continue
+            started.append(application)
+            await on_startup(application)
+            await application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+            await application.start()
+            logger.info(f"Tenant @{application.bot.username} started")
+        if started:
+            await stop.wait()
+        else:
+            logger.error("No tenant could be started")
+    finally:
+        # Stop everything before shutting anything down: handlers of one
+        # tenant may still be running while another one stops
+        for application in started:
+            if application.updater.running:
+                await application.updater.stop()
+        for application in started:
+            if application.running:
+                await application.stop()
+        for application in started:
+            await application.shutdown()
+            await on_shutdown(application)
+        await shared_request.close()
+
+def main():
+    # The health server is already up; Mongo connects in the background while
+    # the application is built, and on_startup waits for it before polling
+    if BOT_TOKENS:
+        tracer.configure(os.path.join(TRACE_DIR, 'traces.jsonl'))
+        asyncio.run(run_tenants(BOT_TOKENS))
+        tracer.shutdown()
+        return
+    
+    start_storage([default_tenant])
+    
+    if BOT_WORKERS > 1:
+        run_receiver(BOT_WORKERS)
+        return
+    
+    tracer.configure(os.path.join(TRACE_DIR, 'traces.jsonl'))
+    build_application().run_polling()
+    tracer.shutdown()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
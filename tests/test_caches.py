@@ -0,0 +1,186 @@
+"""Tests for the enforcement caches and their warm-restart snapshots.
+
+Run with: python -m pytest tests (or python -m unittest discover tests)
+"""
+import os
+import sys
+import time
+import pickle
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot
+
+class TtlCacheTest(unittest.TestCase):
+
+    def test_get_until_expiry(self):
+        cache = bot.TtlCache(60)
+        cache.set('live', 1)
+        cache.set('expired', 2, ttl=-1)
+
+        self.assertEqual(cache.get('live'), 1)
+        self.assertIsNone(cache.get('expired'))
+        self.assertEqual(cache.get('missing', bot.MISSING), bot.MISSING)
+        # Expired entries are dropped when read
+        self.assertNotIn('expired', cache.entries)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_per_entry_ttl(self):
+        cache = bot.TtlCache(60)
+        now = time.time()
+        cache.set('default', 1)
+        cache.set('long', 2, ttl=3600)
+
+        self.assertAlmostEqual(cache.entries['default'][0], now + 60, delta=1)
+        self.assertAlmostEqual(cache.entries['long'][0], now + 3600, delta=1)
+        with mock.patch.object(bot.time, 'time', return_value=now + 120):
+            self.assertIsNone(cache.get('default'))
+            self.assertEqual(cache.get('long'), 2)
+
+    def test_prune_when_full_drops_expired_first(self):
+        cache = bot.TtlCache(60, max_entries=4)
+        cache.set('a', 1, ttl=-1)
+        cache.set('b', 2, ttl=-1)
+        cache.set('c', 3)
+        cache.set('d', 4)
+        cache.set('e', 5)
+
+        self.assertEqual(set(cache.entries), {'c', 'd', 'e'})
+
+    def test_prune_when_full_of_live_entries_keeps_longest_lived(self):
+        cache = bot.TtlCache(60, max_entries=4)
+        for key, ttl in (('a', 10), ('b', 40), ('c', 20), ('d', 30)):
+            cache.set(key, key, ttl=ttl)
+        cache.set('e', 'e', ttl=50)
+
+        self.assertEqual(set(cache.entries), {'b', 'd', 'e'})
+
+    def test_live_items_and_pop(self):
+        cache = bot.TtlCache(60)
+        cache.set('a', 1)
+        cache.set('b', 2, ttl=-1)
+        cache.pop('a')
+        cache.pop('never-set')
+        cache.set('c', 3)
+
+        self.assertEqual([(key, value) for key, _, value in cache.live_items()], [('c', 3)])
+
+    def test_pop_where(self):
+        cache = bot.TtlCache(60)
+        cache.set(('@old', 1), 'member')
+        cache.set(('@old', 2), 'left')
+        cache.set(('@new', 1), 'member')
+
+        self.assertEqual(cache.pop_where(lambda key: key[0] == '@old'), 2)
+        self.assertEqual(set(cache.entries), {('@new', 1)})
+
+    def test_load_skips_expired_entries(self):
+        now = time.time()
+        cache = bot.TtlCache(60)
+        loaded = cache.load({'live': (now + 30, 1), 'expired': (now - 30, 2)})
+
+        self.assertEqual(loaded, 1)
+        self.assertEqual(cache.get('live'), 1)
+        self.assertNotIn('expired', cache.entries)
+
+class SnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.tenant = self.make_tenant()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def make_tenant(self) -> bot.Tenant:
+        tenant = bot.Tenant('test_snapshot')
+        tenant.snapshot_path = os.path.join(self.directory.name, 'snapshot.pickle')
+        return tenant
+
+    def test_round_trip(self):
+        self.tenant.config_cache.set(-100, {'channel': 'required'})
+        self.tenant.member_cache.set(('@required', 7), 'member')
+        self.tenant.member_cache.set(('@required', 8), 'left', ttl=-1)
+        self.tenant.speaker_cache.set((-100, 7), True)
+        self.tenant.write_snapshot(self.tenant.snapshot())
+        self.assertFalse(os.path.exists(f"{self.tenant.snapshot_path}.tmp"))
+
+        restored = self.make_tenant()
+        restored.load_snapshot()
+
+        self.assertEqual(restored.config_cache.get(-100), {'channel': 'required'})
+        self.assertEqual(restored.member_cache.get(('@required', 7)), 'member')
+        self.assertNotIn(('@required', 8), restored.member_cache.entries)
+        self.assertEqual(restored.speaker_cache.get((-100, 7)), True)
+        # Expiry times carry over instead of restarting
+        self.assertEqual(
+            restored.member_cache.entries[('@required', 7)][0],
+            self.tenant.member_cache.entries[('@required', 7)][0]
+        )
+
+    def test_version_mismatch_is_ignored(self):
+        self.tenant.config_cache.set(-100, {'channel': 'required'})
+        snapshot = self.tenant.snapshot()
+        snapshot['version'] = bot.SNAPSHOT_VERSION + 1
+        self.tenant.write_snapshot(snapshot)
+
+        restored = self.make_tenant()
+        restored.load_snapshot()
+
+        self.assertEqual(restored.config_cache.entries, {})
+
+    def test_missing_or_corrupt_file_is_ignored(self):
+        self.tenant.load_snapshot()
+        with open(self.tenant.snapshot_path, 'wb') as f:
+            f.write(b'not a pickle')
+        self.tenant.load_snapshot()
+
+        self.assertEqual(self.tenant.config_cache.entries, {})
+
+    def test_snapshot_is_a_copy(self):
+        self.tenant.admin_cache.set((-100, 7), 'member')
+        snapshot = self.tenant.snapshot()
+        self.tenant.admin_cache.set((-100, 8), 'member')
+
+        self.assertEqual(set(snapshot['caches']['admin_cache']), {(-100, 7)})
+        self.assertEqual(set(snapshot['caches']), set(bot.CACHE_NAMES))
+        pickle.dumps(snapshot)
+
+class FakeProgress:
+
+    def __init__(self):
+        self.text = None
+
+    async def edit_text(self, text):
+        self.text = text
+
+class AuditVerdictTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_verdict_lifetimes(self):
+        statuses = {1: 'member', 2: 'left', 3: 'kicked'}
+
+        async def get_chat_member(chat_id, user_id):
+            return SimpleNamespace(status=statuses[user_id])
+
+        tenant = bot.Tenant('test_audit')
+        context = SimpleNamespace(bot=SimpleNamespace(get_chat_member=get_chat_member), chat_data={'audit_running': True})
+        progress = FakeProgress()
+        now = time.time()
+        with bot.tenant_scope(tenant):
+            await bot.audit_group(-100, '@required', [1, 2, 3], progress, context)
+
+        entries = tenant.member_cache.entries
+        self.assertAlmostEqual(entries[('@required', 1)][0], now + bot.AUDIT_MEMBER_TTL, delta=1)
+        # Not-joined verdicts last no longer than an ordinary lookup would
+        self.assertAlmostEqual(entries[('@required', 2)][0], now + bot.MEMBER_CACHE_TTL, delta=1)
+        self.assertAlmostEqual(entries[('@required', 3)][0], now + bot.MEMBER_CACHE_TTL, delta=1)
+        self.assertLessEqual(bot.AUDIT_MEMBER_TTL, 3600)
+        self.assertIn("Not joined: 2", progress.text)
+        self.assertFalse(context.chat_data['audit_running'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,186 @@
+"""Tests for the Bot API rate governor.
+
+Run with: python -m pytest tests (or python -m unittest discover tests)
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Update
+from telegram.error import RetryAfter, TimedOut
+from telegram.request import BaseRequest
+
+import bot
+
+class RateGovernorTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.governor = bot.RateGovernor(20, 20, 1)
+        await self.governor.initialize()
+
+    async def asyncTearDown(self):
+        await self.governor.shutdown()
+
+    def request(self, priority: int, callback, endpoint: str = 'getChat'):
+        return self.governor.process_request(callback, (), {}, endpoint, {}, priority)
+
+    async def test_waiting_requests_are_released_by_priority(self):
+        released = []
+
+        def sender(priority):
+            async def callback():
+                released.append(priority)
+            return callback
+
+        # Empty the global bucket so all three requests have to queue
+        self.governor.global_bucket.tokens = 0
+        await asyncio.gather(*(
+            self.request(priority, sender(priority))
+            for priority in (bot.PRIORITY_BROADCAST, bot.PRIORITY_CLEANUP, bot.PRIORITY_CALLBACK)
+        ))
+
+        self.assertEqual(released, [bot.PRIORITY_CALLBACK, bot.PRIORITY_CLEANUP, bot.PRIORITY_BROADCAST])
+        self.assertEqual(self.governor.queue_depth(), 0)
+
+    async def test_broadcast_bucket_bypasses_global_queue(self):
+        released = []
+
+        async def callback():
+            released.append(True)
+
+        self.governor.broadcast_bucket = bot.TokenBucket(10, 10)
+        self.governor.global_bucket.block(5)
+        await asyncio.wait_for(self.request(bot.PRIORITY_BROADCAST, callback), timeout=1)
+        self.assertEqual(released, [True])
+        self.assertEqual(self.governor.queue_depth(), 0)
+
+    async def test_retry_after_pauses_and_retries(self):
+        attempts = []
+
+        async def callback():
+            attempts.append(time.monotonic())
+            if len(attempts) == 1:
+                raise RetryAfter(1)
+            return 'sent'
+
+        self.assertEqual(await self.request(bot.PRIORITY_MUTE, callback), 'sent')
+        self.assertEqual(len(attempts), 2)
+        self.assertGreaterEqual(attempts[1] - attempts[0], 0.9)
+
+    async def test_retry_after_beyond_deadline_is_raised(self):
+        async def callback():
+            raise RetryAfter(30)
+
+        with self.assertRaises(RetryAfter):
+            await self.request(bot.PRIORITY_CALLBACK, callback)
+
+    async def test_timed_out_once_deadline_passes(self):
+        sent = []
+
+        async def callback():
+            sent.append(True)
+
+        self.governor.global_bucket.block(5)
+        with mock.patch.dict(bot.PRIORITY_DEADLINES, {bot.PRIORITY_BROADCAST: 0.1}):
+            with self.assertRaises(TimedOut):
+                await self.request(bot.PRIORITY_BROADCAST, callback)
+        self.assertEqual(sent, [])
+
+BOT_ID = 42
+CHANNEL_ID = -1009999
+
+class FakeRequest(BaseRequest):
+    """In-memory Bot API: users are group members who never joined the channel"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        endpoint = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls.append((time.monotonic(), endpoint, params.get('chat_id')))
+        if endpoint == 'getMe':
+            result = {'id': BOT_ID, 'is_bot': True, 'first_name': 'Bot', 'username': 'test_bot'}
+        elif endpoint == 'getChatMember':
+            user_id = int(params['user_id'])
+            status = 'left' if int(params['chat_id']) == CHANNEL_ID else 'member'
+            result = {'status': status, 'user': {'id': user_id, 'is_bot': False, 'first_name': 'U'}}
+        elif endpoint == 'sendMessage':
+            result = {
+                'message_id': len(self.calls), 'date': int(time.time()),
+                'chat': {'id': int(params['chat_id']), 'type': 'supergroup'}, 'text': 'warning',
+            }
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+def group_message(update_id: int, chat_id: int, user_id: int) -> dict:
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'supergroup', 'title': 'Group'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'User'},
+            'text': 'hello',
+        },
+    }
+
+class ChatFloodTest(unittest.IsolatedAsyncioTestCase):
+    """A group at its per-chat send limit must not hold up other groups"""
+
+    async def test_flooded_chat_does_not_delay_other_chats(self):
+        tenant = bot.Tenant('test_flood')
+        for chat_id in (-100, -200):
+            tenant.config_cache.set(chat_id, {'chat_id': chat_id, 'channel': 'required', 'channel_id': CHANNEL_ID})
+        tenant.permission_cache.set(CHANNEL_ID, 'administrator')
+        request = FakeRequest()
+        application = bot.build_application(
+            f"{BOT_ID}:test",
+            tenant=tenant,
+            limiter=bot.RateGovernor(1000, 20, 1),
+            request=request,
+            receive_updates=False
+        )
+
+        async with application:
+            await application.start()
+            for update_id in range(30):
+                await application.update_queue.put(
+                    Update.de_json(group_message(update_id, -100, 1000 + update_id), application.bot)
+                )
+            await asyncio.sleep(0.2)
+            queued = time.monotonic()
+            await application.update_queue.put(Update.de_json(group_message(99, -200, 5000), application.bot))
+
+            deadline = time.monotonic() + 5
+            while time.monotonic() < deadline:
+                if any(endpoint == 'sendMessage' and chat_id == -200 for _, endpoint, chat_id in request.calls):
+                    break
+                await asyncio.sleep(0.05)
+            await application.stop()
+
+        warned = [(at, chat_id) for at, endpoint, chat_id in request.calls if endpoint == 'sendMessage']
+        other = [at for at, chat_id in warned if chat_id == -200]
+        self.assertTrue(other, "the other group's warning was never sent")
+        self.assertLess(other[0] - queued, 1)
+        restricted = [chat_id for _, endpoint, chat_id in request.calls if endpoint == 'restrictChatMember']
+        self.assertEqual(restricted.count(-100), 30)
+        # Only the burst the group bucket allows was warned about
+        self.assertEqual(sum(1 for _, chat_id in warned if chat_id == -100), 3)
+
+if __name__ == '__main__':
+    unittest.main()
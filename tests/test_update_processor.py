@@ -0,0 +1,161 @@
+"""Tests for the priority update scheduler.
+
+Run with: python -m pytest tests (or python -m unittest discover tests)
+"""
+import os
+import sys
+import time
+import asyncio
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Update
+
+import bot
+
+def message_update(update_id: int, chat_id: int, user_id: int, text: str = 'hello', entities=None) -> Update:
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': chat_id, 'type': 'supergroup', 'title': 'Group'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'User'},
+        'text': text,
+    }
+    if entities:
+        message['entities'] = entities
+    return Update.de_json({'update_id': update_id, 'message': message}, None)
+
+def callback_update(update_id: int, user_id: int) -> Update:
+    return Update.de_json({
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'User'},
+            'chat_instance': 'instance',
+            'data': 'unmute',
+        },
+    }, None)
+
+class PriorityUpdateProcessorTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.processor = bot.PriorityUpdateProcessor(1, 2)
+        self.gate = asyncio.Event()
+        self.ran = []
+
+    async def handler(self, update_id: int, gated: bool = False):
+        self.ran.append(update_id)
+        if gated:
+            await self.gate.wait()
+        else:
+            await asyncio.sleep(0)
+
+    async def occupy_worker(self):
+        """Start an update that holds the only worker until the gate opens"""
+        task = asyncio.create_task(
+            self.processor.do_process_update(message_update(1, -100, 1), self.handler(1, gated=True))
+        )
+        await asyncio.sleep(0)
+        self.assertEqual(self.processor.active, 1)
+        return task
+
+    async def submit(self, update, update_id: int):
+        task = asyncio.create_task(self.processor.do_process_update(update, self.handler(update_id)))
+        await asyncio.sleep(0)
+        return task
+
+    def assert_idle(self):
+        self.assertEqual(self.processor.active, 0)
+        self.assertEqual(self.processor.busy_lanes, set())
+        self.assertEqual(self.processor.queue_depth(), 0)
+
+    async def test_waiting_updates_run_by_priority(self):
+        blocker = await self.occupy_worker()
+        tasks = [
+            await self.submit(message_update(2, -100, 2), 2),
+            await self.submit(callback_update(3, 3), 3),
+        ]
+
+        self.gate.set()
+        await asyncio.gather(blocker, *tasks)
+
+        self.assertEqual(self.ran, [1, 3, 2])
+        self.assert_idle()
+
+    async def test_full_queue_sheds_lowest_priority_newest_waiter(self):
+        blocker = await self.occupy_worker()
+        tasks = [
+            await self.submit(message_update(2, -100, 2), 2),
+            await self.submit(message_update(3, -100, 3), 3),
+            # Queue is full; the callback displaces the newest enforcement update
+            await self.submit(callback_update(4, 4), 4),
+            # An update no better than anything queued is dropped on arrival
+            await self.submit(message_update(5, -100, 5), 5),
+        ]
+
+        self.gate.set()
+        await asyncio.gather(blocker, *tasks)
+
+        self.assertEqual(self.ran, [1, 4, 2])
+        self.assertEqual(self.processor.shed_count, 2)
+        self.assert_idle()
+
+    async def test_same_user_in_same_chat_runs_serially(self):
+        processor = bot.PriorityUpdateProcessor(4, 10)
+        running = set()
+        overlaps = []
+
+        async def handler(update_id):
+            lane = 'same' if update_id < 10 else update_id
+            if lane in running:
+                overlaps.append(update_id)
+            running.add(lane)
+            await asyncio.sleep(0.01)
+            running.discard(lane)
+
+        updates = [message_update(update_id, -100, 7) for update_id in range(3)]
+        updates.append(message_update(10, -100, 8))
+        await asyncio.gather(*(
+            processor.do_process_update(update, handler(update.update_id)) for update in updates
+        ))
+
+        self.assertEqual(overlaps, [])
+        self.assertEqual(processor.active, 0)
+        self.assertEqual(processor.busy_lanes, set())
+
+    def test_lanes_are_per_bot(self):
+        first_bot = mock.Mock(id=1)
+        second_bot = mock.Mock(id=2)
+        first = message_update(1, -100, 7)
+        second = message_update(1, -100, 7)
+        first.set_bot(first_bot)
+        second.set_bot(second_bot)
+
+        self.assertNotEqual(self.processor.lane(first), self.processor.lane(second))
+        self.assertEqual(self.processor.classify(first), bot.UPDATE_PRIORITY_ENFORCEMENT)
+        # The same message seen by another hosted bot is not a repeat
+        self.assertEqual(self.processor.classify(second), bot.UPDATE_PRIORITY_ENFORCEMENT)
+        repeat = message_update(2, -100, 7)
+        repeat.set_bot(first_bot)
+        self.assertEqual(self.processor.classify(repeat), bot.UPDATE_PRIORITY_DUPLICATE)
+
+    def test_only_registered_commands_are_interactive(self):
+        command = [{'type': 'bot_command', 'offset': 0, 'length': 5}]
+        self.assertEqual(
+            self.processor.classify(message_update(1, -100, 1, '/fsub audit', command)),
+            bot.UPDATE_PRIORITY_INTERACTIVE
+        )
+        self.assertEqual(
+            self.processor.classify(message_update(2, -100, 2, '/spam', command)),
+            bot.UPDATE_PRIORITY_ENFORCEMENT
+        )
+        self.assertEqual(
+            self.processor.classify(message_update(3, -100, 3, '/fsub')),
+            bot.UPDATE_PRIORITY_ENFORCEMENT
+        )
+        self.assertEqual(self.processor.classify(callback_update(4, 4)), bot.UPDATE_PRIORITY_INTERACTIVE)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+"""Tests for the write-behind user upsert buffer.
+
+Run with: python -m pytest tests (or python -m unittest discover tests)
+"""
+import os
+import sys
+import asyncio
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot
+
+class FakeCollection:
+    """Records bulk_write calls; can fail or block until released"""
+
+    def __init__(self, fail: bool = False, block: bool = False):
+        self.fail = fail
+        self.writes = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        if not block:
+            self.release.set()
+
+    def bulk_write(self, operations, ordered=True):
+        self.started.set()
+        self.release.wait(5)
+        if self.fail:
+            raise RuntimeError("mongo down")
+        self.writes.append({op._filter['user_id']: op._doc['$set'] for op in operations})
+
+class UserUpsertBufferTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_updates_for_one_user_are_merged(self):
+        collection = FakeCollection()
+        buffer = bot.UserUpsertBuffer(collection, 100, 5)
+        buffer.add(1, {'first_name': 'old'})
+        buffer.add(1, {'first_name': 'new'})
+        buffer.add(2, {'first_name': 'other'})
+
+        await buffer.flush()
+
+        self.assertEqual(collection.writes, [{1: {'first_name': 'new'}, 2: {'first_name': 'other'}}])
+        self.assertEqual(buffer.pending, {})
+        self.assertEqual(buffer.written_total, 2)
+
+    async def test_flush_starts_when_max_size_is_reached(self):
+        collection = FakeCollection()
+        buffer = bot.UserUpsertBuffer(collection, 3, 5)
+        buffer.add(1, {})
+        buffer.add(2, {})
+        self.assertIsNone(buffer.flush_task)
+
+        buffer.add(3, {})
+        self.assertIsNotNone(buffer.flush_task)
+        await buffer.flush_task
+
+        self.assertEqual(len(collection.writes), 1)
+        self.assertEqual(set(collection.writes[0]), {1, 2, 3})
+
+    async def test_failed_flush_keeps_newer_entries(self):
+        collection = FakeCollection(fail=True, block=True)
+        buffer = bot.UserUpsertBuffer(collection, 100, 5)
+        buffer.add(1, {'first_name': 'old'})
+        buffer.add(2, {'first_name': 'kept'})
+
+        flush = asyncio.create_task(buffer.flush())
+        while not collection.started.is_set():
+            await asyncio.sleep(0.01)
+        # Arrives while the failing write is in flight
+        buffer.add(1, {'first_name': 'new'})
+        collection.release.set()
+        await flush
+
+        self.assertEqual(buffer.pending, {1: {'first_name': 'new'}, 2: {'first_name': 'kept'}})
+        self.assertEqual(buffer.flush_count, 0)
+
+    async def test_max_pending_is_enforced(self):
+        collection = FakeCollection(fail=True)
+        buffer = bot.UserUpsertBuffer(collection, 100, 5, max_pending=3)
+        for user_id in range(5):
+            buffer.add(user_id, {})
+        self.assertEqual(set(buffer.pending), {0, 1, 2})
+        self.assertEqual(buffer.dropped, 2)
+
+        # Known users still get their newest fields while the buffer is full
+        buffer.add(0, {'first_name': 'newer'})
+        self.assertEqual(buffer.pending[0], {'first_name': 'newer'})
+
+        await buffer.flush()
+        self.assertEqual(len(buffer.pending), 3)
+
+        collection.fail = False
+        await buffer.flush()
+        self.assertEqual(buffer.pending, {})
+        self.assertEqual(buffer.dropped, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+"""Summarize update traces written by the bot.
+
+Reads the JSONL trace files (rotated backups included) and prints:
+
+* per update type: count and p50 / p95 / max duration
+* the critical path: which spans the slow updates were actually waiting
+  on, with "scheduler.queue" for time spent waiting for a worker and
+  "(handler)" for time not covered by any queue, Bot API or Mongo span
+* the slowest traces with their critical path spelled out
+
+Usage: python trace_report.py [paths ...] [--top N] [--slow-only]
+Paths default to traces/*.jsonl*.
+"""
+import sys
+import glob
+import json
+import argparse
+from collections import defaultdict
+
+SELF_TIME = '(handler)'
+
+def load_traces(paths):
+    traces = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        traces.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue
+    return traces
+
+def percentile(values, fraction):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+def critical_path(trace):
+    """Walk back from the end of the update, always following the span
+    that finished last before the current point. Gaps are handler time.
+
+    Returns a list of (name, milliseconds) in chronological order.
+    """
+    spans = sorted(trace['spans'], key=lambda span: span['start_ms'] + span['duration_ms'])
+    cursor = trace['duration_ms']
+    path = []
+    while True:
+        candidates = [span for span in spans if span['start_ms'] + span['duration_ms'] <= cursor + 1e-6]
+        if not candidates:
+            break
+        span = candidates[-1]
+        end = span['start_ms'] + span['duration_ms']
+        if cursor - end > 0:
+            path.append((SELF_TIME, cursor - end))
+        path.append((span['name'], span['duration_ms']))
+        cursor = span['start_ms']
+        spans = [s for s in spans if s['start_ms'] + s['duration_ms'] <= cursor + 1e-6 and s is not span]
+    if cursor > 0:
+        path.append((SELF_TIME, cursor))
+    path.reverse()
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='*')
+    parser.add_argument('--top', type=int, default=5, help="number of slowest traces to show")
+    parser.add_argument('--slow-only', action='store_true', help="only traces over the slow threshold")
+    args = parser.parse_args()
+
+    paths = args.paths or sorted(glob.glob('traces/*.jsonl*'))
+    traces = load_traces(paths)
+    if args.slow_only:
+        traces = [trace for trace in traces if trace.get('slow')]
+    if not traces:
+        print("No traces found.")
+        sys.exit(1)
+
+    print(f"{len(traces)} traces from {len(paths)} file(s)\n")
+
+    by_name = defaultdict(list)
+    for trace in traces:
+        by_name[trace['name']].append(trace['duration_ms'])
+    print(f"{'update':<36} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    for name, durations in sorted(by_name.items(), key=lambda item: -len(item[1])):
+        print(
+            f"{name:<36} {len(durations):>6} {percentile(durations, 0.5):>9.1f} "
+            f"{percentile(durations, 0.95):>9.1f} {max(durations):>9.1f}"
+        )
+
+    critical = defaultdict(float)
+    occurrences = defaultdict(list)
+    total = 0.0
+    paths_by_trace = {}
+    for trace in traces:
+        path = critical_path(trace)
+        paths_by_trace[trace['trace_id']] = path
+        for name, milliseconds in path:
+            critical[name] += milliseconds
+            occurrences[name].append(milliseconds)
+            total += milliseconds
+
+    print(f"\n{'critical path span':<36} {'share':>6} {'total ms':>10} {'p95 ms':>9}")
+    for name, milliseconds in sorted(critical.items(), key=lambda item: -item[1]):
+        share = milliseconds / total if total else 0
+        print(f"{name:<36} {share:>6.1%} {milliseconds:>10.1f} {percentile(occurrences[name], 0.95):>9.1f}")
+
+    print(f"\nSlowest {min(args.top, len(traces))} traces")
+    for trace in sorted(traces, key=lambda trace: -trace['duration_ms'])[:args.top]:
+        attributes = trace.get('attributes', {})
+        print(
+            f"\n{trace['trace_id']} {trace['name']} {trace['duration_ms']:.1f} ms "
+            f"(queued {attributes.get('queued_ms', 0):.1f} ms) "
+            f"chat={attributes.get('chat_id')} user={attributes.get('user_id')}"
+        )
+        for name, milliseconds in paths_by_trace[trace['trace_id']]:
+            print(f"    {milliseconds:>9.1f} ms  {name}")
+
+if __name__ == '__main__':
+    main()